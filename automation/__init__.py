@@ -1,4 +1,8 @@
 from automation.assigner import assign_ticket
+from automation.batch import triage_batch
+from automation.cache import PredictionCache, prediction_cache
 from automation.categorizer import predict_category
 from automation.prioritizer import predict_priority
-from automation.priority import priority_weights
\ No newline at end of file
+from automation.priority import priority_weights
+from automation.scheduler import TriageScheduler
+from automation.workload import WorkloadTracker
\ No newline at end of file
@@ -1,11 +1,13 @@
 import pandas as pd
 
-from automation.priority import priority_weights
+from automation.workload import WorkloadTracker
 
 def assign_ticket(open_tickets: pd.DataFrame, assignees: pd.DataFrame) -> str:
     """
     Assigns the next ticket to the assignee with the most capacity based on current workload.
 
+    Builds the workload from scratch, use a WorkloadTracker to assign several tickets in a row.
+
     Parameters:
         open_tickets: The current DataFrame of all tickets.
         assignees: DataFrame of available assignees with 'name' column.
@@ -13,17 +15,8 @@ def assign_ticket(open_tickets: pd.DataFrame, assignees: pd.DataFrame) -> str:
     Returns:
         str: Name of the selected assignee.
     """
-    # Initialize workloads
-    workload = {row['name']: 0 for _, row in assignees.iterrows()}
-
-    # Calculate workload from existing tickets
-    for _, row in open_tickets.iterrows():
-        assignee = row.get("assignee")
-        priority = row.get("priority", "Medium")
-        if assignee in workload:
-            workload[assignee] += priority_weights.get(priority, 2)
+    # Workload of every ticket passed in, whatever its status
+    workload = WorkloadTracker.from_tickets(open_tickets, assignees['name'], statuses=None)
 
     # Select assignee with the lowest current workload
-    chosen = min(workload, key=workload.get)
-
-    return chosen
\ No newline at end of file
+    return workload.next_assignee()
@@ -0,0 +1,146 @@
+from concurrent.futures import Executor
+
+import pandas as pd
+
+from automation.cache import prediction_cache
+from automation.categorizer import category_engine
+from automation.prioritizer import category_priority_map, priority_engine
+from automation.workload import WorkloadTracker
+from monitoring import registry
+
+
+def _ticket_text(summaries: pd.Series, descriptions: pd.Series) -> pd.Series:
+    # Same text as the f"{summary} {description}".lower() built per ticket. Missing values become "",
+    # astype(str) keeps them missing with the pandas string dtype
+    return (summaries.fillna("").astype(str) + " " + descriptions.fillna("").astype(str)).str.lower()
+
+
+def predict_categories(summaries: pd.Series, descriptions: pd.Series) -> pd.Series:
+    """Batch equivalent of predict_category."""
+    return prediction_cache.match_series(category_engine, _ticket_text(summaries, descriptions))
+
+
+def predict_priorities(summaries: pd.Series, descriptions: pd.Series, categories: pd.Series) -> pd.Series:
+    """Batch equivalent of predict_priority."""
+    priorities = categories.map(category_priority_map).astype(object)
+    unknown = priorities.isnull()
+    if unknown.any():
+        text = _ticket_text(summaries[unknown], descriptions[unknown])
+        priorities[unknown] = prediction_cache.match_series(priority_engine, text)
+    return priorities
+
+
+def _predict_missing(result: pd.DataFrame, summaries: pd.Series, descriptions: pd.Series, model_path: str = None):
+    """
+    Fill in the missing categories and priorities of result, in place. With a model_path, the learned
+    model saved there (see automation.model) predicts both instead of the keyword rules.
+    """
+    model = None
+    if model_path:
+        from automation.model import load_model
+        model = load_model(model_path)
+    with registry.timer('ticket_watcher_stage_seconds', stage='categorize'):
+        missing = result['category'].isnull()
+        if missing.any():
+            if model is None:
+                result.loc[missing, 'category'] = predict_categories(summaries[missing], descriptions[missing])
+            else:
+                text = _ticket_text(summaries[missing], descriptions[missing])
+                result.loc[missing, 'category'] = prediction_cache.match_series(model.category, text)
+
+    with registry.timer('ticket_watcher_stage_seconds', stage='prioritize'):
+        missing = result['priority'].isnull()
+        if missing.any():
+            if model is None:
+                result.loc[missing, 'priority'] = predict_priorities(summaries[missing], descriptions[missing],
+                                                                     result['category'][missing])
+            else:
+                text = _ticket_text(summaries[missing], descriptions[missing])
+                result.loc[missing, 'priority'] = prediction_cache.match_series(model.priority, text)
+
+
+def classify_chunk(summaries: list, descriptions: list, categories: list, priorities: list,
+                   model_path: str = None) -> tuple:
+    """
+    Fill in the missing categories and priorities of one chunk of tickets. Module-level and working on
+    plain lists so it can run on a process pool, each worker loads the model once from model_path.
+
+    Returns:
+        tuple: The categories and the priorities, as lists.
+    """
+    result = pd.DataFrame({'category': categories, 'priority': priorities}, dtype=object)
+    _predict_missing(result, pd.Series(summaries, dtype=object), pd.Series(descriptions, dtype=object),
+                     model_path)
+    return result['category'].tolist(), result['priority'].tolist()
+
+
+def classify_sharded(result: pd.DataFrame, pending: pd.DataFrame, executor: Executor, chunk_size: int = 5000,
+                     model_path: str = None):
+    """
+    Fill in the missing categories and priorities of result, in place, by sending chunks of the tickets
+    that need them to the executor (a ProcessPoolExecutor to use several cores).
+    """
+    todo = result['category'].isnull() | result['priority'].isnull()
+    if not todo.any():
+        return
+    columns = [pending['summary'][todo].tolist(), pending['description'][todo].tolist(),
+               result['category'][todo].tolist(), result['priority'][todo].tolist()]
+    chunks = [[column[start:start + chunk_size] for column in columns] + [model_path]
+              for start in range(0, len(columns[0]), chunk_size)]
+
+    categories, priorities = [], []
+    for chunk_categories, chunk_priorities in executor.map(classify_chunk, *zip(*chunks)):
+        categories += chunk_categories
+        priorities += chunk_priorities
+    result.loc[todo, 'category'] = categories
+    result.loc[todo, 'priority'] = priorities
+
+
+def triage_batch(pending: pd.DataFrame, tickets: pd.DataFrame, users: pd.DataFrame,
+                 workload: WorkloadTracker = None, executor: Executor = None, chunk_size: int = 5000,
+                 model_path: str = None) -> pd.DataFrame:
+    """
+    Categorizes, prioritizes and assigns every pending ticket in one go.
+
+    Gives the same result as processing the pending tickets one by one in index order:
+    each assignment goes to the least loaded user, ties broken by user order, and the
+    load of every triaged ticket is counted before the next one is assigned.
+
+    Parameters:
+        pending: Tickets to triage, existing category/priority/assignee values are kept.
+        tickets: All tickets, used to compute the current workload.
+        users: DataFrame of available assignees with 'name' column.
+        workload: Tracker of the current workload, kept up to date with the assignments.
+            Seeded from tickets when not given.
+        executor: When given, categorization and prioritization run on it in chunks of chunk_size
+            tickets. Assignment always stays here, so the load balancing sees every decision.
+        model_path: Learned model (see automation.model) predicting the categories and priorities
+            instead of the keyword rules.
+
+    Returns:
+        pd.DataFrame: ticket_id, category, priority and assignee of the pending tickets.
+    """
+    result = pending[['ticket_id', 'category', 'priority', 'assignee']].astype(object)
+
+    if executor is not None:
+        with registry.timer('ticket_watcher_stage_seconds', stage='classify'):
+            classify_sharded(result, pending, executor, chunk_size, model_path)
+    else:
+        _predict_missing(result, pending['summary'], pending['description'], model_path)
+
+    with registry.timer('ticket_watcher_stage_seconds', stage='assign'):
+        # Current workload of the tickets being worked on
+        if workload is None:
+            workload = WorkloadTracker.from_tickets(tickets, users['name'])
+
+        assignees = []
+        for ticket_id, status, assignee, priority in zip(result['ticket_id'], pending['status'],
+                                                         result['assignee'], result['priority']):
+            if pd.isnull(assignee):
+                assignee = workload.next_assignee()
+            # Counted with its new priority before the next ticket is assigned
+            workload.update(ticket_id, assignee, priority, status)
+            assignees.append(assignee)
+        result['assignee'] = assignees
+
+    return result
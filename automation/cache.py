@@ -0,0 +1,98 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+import pandas as pd
+
+from automation.rules import RuleEngine
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of rule engine results.
+
+    Entries are keyed on the rule-set version of the engine and a digest of the normalized
+    (lowercased summary + description) text, the exact text the engine matches on. An
+    engine built from different rules has a different version, so results of older rules
+    are never returned and simply age out. maxsize=0 disables caching.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(engine: RuleEngine, text: str) -> tuple:
+        return engine.version, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _get(self, key):
+        with self._lock:
+            label = self._entries.get(key)
+            if label is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return label
+
+    def _put(self, items):
+        """Store (key, label) pairs and evict the least recently used entries beyond maxsize."""
+        with self._lock:
+            for key, label in items:
+                self._entries[key] = label
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def match(self, engine: RuleEngine, text: str) -> str:
+        """engine.match(text), from the cache when the same text was matched by the same rules."""
+        if not self.maxsize:
+            return engine.match(text)
+        key = self._key(engine, text)
+        label = self._get(key)
+        if label is None:
+            label = engine.match(text)
+            self._put([(key, label)])
+        return label
+
+    def match_series(self, engine: RuleEngine, text: pd.Series) -> pd.Series:
+        """engine.match_series(text), only the distinct texts missing from the cache are matched."""
+        if not self.maxsize or text.empty:
+            return engine.match_series(text)
+        values = list(dict.fromkeys(text.tolist()))
+        keys = [self._key(engine, value) for value in values]
+        with self._lock:
+            labels = [self._entries.get(key) for key in keys]
+            for key, label in zip(keys, labels):
+                if label is not None:
+                    self._entries.move_to_end(key)
+            missing = [i for i, label in enumerate(labels) if label is None]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            matched = engine.match_series(pd.Series([values[i] for i in missing], dtype=object))
+            for i, label in zip(missing, matched):
+                labels[i] = label
+            self._put([(keys[i], labels[i]) for i in missing])
+        return text.map(dict(zip(values, labels))).astype(object)
+
+    def stats(self) -> dict:
+        """Hits, misses, evictions, current size and hit rate."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._entries),
+                'maxsize': self.maxsize, 'hit_rate': self.hits / lookups if lookups else None}
+
+    def clear(self):
+        """Drop every entry and reset the stats."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+# Shared by the per-ticket and batch predictions
+prediction_cache = PredictionCache()
@@ -0,0 +1,267 @@
+"""
+Learned alternative to the keyword rules: a linear classifier over hashed TF-IDF features, in NumPy.
+
+Trained on the closed tickets, persisted to an .npz file and loaded lazily. A TextClassifier has the
+interface of a RuleEngine (version, match, match_series), so the batch triage and the prediction cache
+take either.
+
+Usage: python -m automation.model train [tickets file] [model file]
+       python -m automation.model report [tickets file] [model file]
+"""
+import hashlib
+import os
+import re
+import sys
+import zlib
+from itertools import chain
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+# Bumped whenever the features or the file layout change, older files are refused
+model_format = 1
+default_model_file = "database/ticket_model.npz"
+_token = re.compile(r"[a-z0-9]+")
+
+
+def _features(text: pd.Series, n_features: int) -> tuple:
+    """
+    Sparse hashed features of lowercased texts: unigrams and bigrams, counted per text.
+
+    Returns:
+        tuple: rows, buckets and counts arrays, sorted by row then bucket.
+    """
+    tokens = text.fillna("").astype(str).str.findall(_token).tolist()
+    lengths = np.fromiter((len(row) for row in tokens), dtype=np.int64, count=len(tokens))
+    codes, uniques = pd.factorize(np.array(list(chain.from_iterable(tokens)), dtype=object))
+    # crc32 instead of hash(), which is salted per process and would not survive a reload
+    hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in uniques), dtype=np.int64,
+                         count=len(uniques))
+    unigrams = hashes[codes]
+    rows = np.repeat(np.arange(len(tokens), dtype=np.int64), lengths)
+
+    # Bigrams pair each token with the next one of the same text
+    same_text = rows[1:] == rows[:-1]
+    bigrams = unigrams[:-1][same_text] * 1_000_003 + unigrams[1:][same_text]
+    rows = np.concatenate([rows, rows[:-1][same_text]])
+    buckets = np.concatenate([unigrams, bigrams]) % n_features
+
+    keys, counts = np.unique(rows * n_features + buckets, return_counts=True)
+    return keys // n_features, keys % n_features, counts
+
+
+def _weights(rows: np.ndarray, buckets: np.ndarray, counts: np.ndarray, idf: np.ndarray, n_texts: int) -> np.ndarray:
+    """Sublinear TF-IDF of the features, L2-normalized per text."""
+    weights = (1 + np.log(counts.astype(np.float32))) * idf[buckets]
+    return weights / np.sqrt(np.bincount(rows, weights ** 2, minlength=n_texts)).astype(np.float32)[rows]
+
+
+class TextClassifier:
+    """
+    Multinomial logistic regression over TF-IDF vectors of hashed unigrams and bigrams.
+
+    Scoring a batch is one sparse-by-dense product of its features with the weights, done in chunks of
+    chunk_size texts to bound memory. Texts without any feature get the default label.
+    """
+
+    def __init__(self, labels: list, weights: np.ndarray, bias: np.ndarray, idf: np.ndarray, default: str,
+                 trained_on: int = 0):
+        self.labels = np.array(labels, dtype=object)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.idf = idf.astype(np.float32)
+        self.default = default
+        self.trained_on = trained_on
+        self.n_features = len(idf)
+        self.chunk_size = 100_000
+        # Fingerprint of the model, cached predictions are only reused for the same version
+        digest = hashlib.sha256()
+        for part in (self.weights.tobytes(), self.bias.tobytes(), self.idf.tobytes(),
+                     "\n".join(self.labels).encode("utf-8"), str(default).encode("utf-8")):
+            digest.update(part)
+        self.version = digest.hexdigest()[:16]
+
+    @classmethod
+    def fit(cls, text: pd.Series, labels: pd.Series, default: str, n_features: int = 2 ** 18, epochs: int = 30,
+            learning_rate: float = 25.0) -> "TextClassifier":
+        """
+        Train on lowercased texts and their labels by full batch gradient descent on the cross-entropy,
+        texts without a label are skipped. learning_rate is the step of the bias along the mean gradient.
+        A text's features are spread over a number of buckets, the weights step that many times further.
+        """
+        known = labels.notna().to_numpy()
+        text, labels = text[known], labels[known]
+        n_texts = len(text)
+        rows, buckets, counts = _features(text, n_features)
+        classes, y = np.unique(labels.astype(str).to_numpy(), return_inverse=True)
+
+        document_frequency = np.bincount(buckets, minlength=n_features)
+        idf = (np.log((1 + n_texts) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = _weights(rows, buckets, counts, idf, n_texts)
+        present, first = np.unique(rows, return_index=True)
+        step = learning_rate / n_texts
+        feature_step = step * len(rows) / max(len(present), 1)
+
+        coefficients = np.zeros((n_features, len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        expected = np.eye(len(classes), dtype=np.float32)[y]
+        for _ in range(epochs):
+            scores = np.broadcast_to(bias, (n_texts, len(classes))).copy()
+            scores[present] += np.add.reduceat(weights[:, None] * coefficients[buckets], first, axis=0)
+            scores -= scores.max(axis=1, keepdims=True)
+            probabilities = np.exp(scores)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            error = probabilities - expected
+            for k in range(len(classes)):
+                gradient = np.bincount(buckets, weights * error[rows, k], minlength=n_features)
+                coefficients[:, k] -= feature_step * gradient
+            bias -= step * error.sum(axis=0)
+        return cls(list(classes), coefficients, bias, idf, default, trained_on=n_texts)
+
+    def scores(self, text: pd.Series) -> np.ndarray:
+        """Score of every text for every label, texts x labels."""
+        scores = np.zeros((len(text), len(self.labels)), dtype=np.float32)
+        for start in range(0, len(text), self.chunk_size):
+            chunk = text.iloc[start:start + self.chunk_size]
+            rows, buckets, counts = _features(chunk, self.n_features)
+            if not len(rows):
+                continue
+            weights = _weights(rows, buckets, counts, self.idf, len(chunk))
+            # Rows are sorted, each text's products are one contiguous run
+            present, first = np.unique(rows, return_index=True)
+            scores[start + present] = (np.add.reduceat(weights[:, None] * self.weights[buckets], first, axis=0)
+                                       + self.bias)
+        return scores
+
+    def match_series(self, text: pd.Series) -> pd.Series:
+        """Label of every lowercased text."""
+        if text.empty:
+            return pd.Series([], index=text.index, dtype=object)
+        scores = self.scores(text)
+        labels = self.labels[scores.argmax(axis=1)]
+        labels[~scores.any(axis=1)] = self.default
+        return pd.Series(labels, index=text.index, dtype=object)
+
+    def match(self, text: str) -> str:
+        """Label of one lowercased text."""
+        return self.match_series(pd.Series([text], dtype=object)).iloc[0]
+
+    def to_arrays(self, prefix: str) -> dict:
+        return {f"{prefix}_labels": self.labels.astype(str), f"{prefix}_weights": self.weights,
+                f"{prefix}_bias": self.bias, f"{prefix}_idf": self.idf,
+                f"{prefix}_meta": np.array([str(self.default), str(self.trained_on)])}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "TextClassifier":
+        default, trained_on = arrays[f"{prefix}_meta"].tolist()
+        return cls(arrays[f"{prefix}_labels"].tolist(), arrays[f"{prefix}_weights"], arrays[f"{prefix}_bias"],
+                   arrays[f"{prefix}_idf"], default, int(trained_on))
+
+
+class TicketModel:
+    """The category and priority classifiers, saved together in one file."""
+
+    def __init__(self, category: TextClassifier, priority: TextClassifier):
+        self.category = category
+        self.priority = priority
+        self.version = f"{category.version}-{priority.version}"
+
+    def save(self, path: str = default_model_file):
+        """Write through a temporary file and a rename."""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, format=np.array([model_format]), **self.category.to_arrays("category"),
+                            **self.priority.to_arrays("priority"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = default_model_file) -> "TicketModel":
+        with np.load(path, allow_pickle=False) as arrays:
+            if int(arrays["format"][0]) != model_format:
+                raise ValueError(f"{path} is a model of format {int(arrays['format'][0])}, expected "
+                                 f"{model_format}: train it again")
+            return cls(TextClassifier.from_arrays(arrays, "category"), TextClassifier.from_arrays(arrays, "priority"))
+
+
+def train(tickets, status: str = 'Closed') -> TicketModel:
+    """
+    Train on the labeled tickets of the given status (the closed history by default). tickets is a
+    DataFrame or an iterable of DataFrame chunks, like JiraMockService.iter_tickets gives.
+    """
+    from automation.batch import _ticket_text
+    from automation.categorizer import default_category
+    from automation.prioritizer import default_priority
+
+    chunks = [tickets] if isinstance(tickets, pd.DataFrame) else tickets
+    history = [chunk.loc[chunk['status'] == status, ['summary', 'description', 'category', 'priority']].astype(object)
+               for chunk in chunks]
+    history = pd.concat(history, ignore_index=True) if history else pd.DataFrame()
+    if history.empty or history['category'].isnull().all() or history['priority'].isnull().all():
+        raise ValueError(f"No {status} tickets with a category and a priority to train on")
+    text = _ticket_text(history['summary'], history['description'])
+    return TicketModel(TextClassifier.fit(text, history['category'], default_category),
+                       TextClassifier.fit(text, history['priority'], default_priority))
+
+
+_loaded = {}
+_load_lock = Lock()
+
+
+def load_model(path: str = default_model_file) -> TicketModel:
+    """The model saved at path, loaded on first use and again only when the file changes."""
+    stamp = os.stat(path).st_mtime_ns
+    with _load_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = _loaded[path] = (stamp, TicketModel.load(path))
+        return cached[1]
+
+
+def accuracy_report(model: TicketModel, tickets: pd.DataFrame) -> pd.DataFrame:
+    """
+    Accuracy of the model and of the keyword rules against the recorded labels of the given tickets,
+    and how often the two agree, for the category and the priority.
+    """
+    from automation.batch import _ticket_text, predict_categories, predict_priorities
+
+    tickets = tickets[tickets['category'].notna() & tickets['priority'].notna()]
+    text = _ticket_text(tickets['summary'], tickets['description'])
+    rule_categories = predict_categories(tickets['summary'], tickets['description'])
+    predictions = {
+        'category': (model.category.match_series(text), rule_categories),
+        'priority': (model.priority.match_series(text),
+                     predict_priorities(tickets['summary'], tickets['description'], rule_categories)),
+    }
+    rows = []
+    for field, (learned, rules) in predictions.items():
+        expected = tickets[field].astype(object)
+        rows.append({'field': field, 'tickets': len(tickets), 'model': (learned == expected).mean(),
+                     'rules': (rules == expected).mean(), 'agreement': (learned == rules).mean()})
+    return pd.DataFrame(rows)
+
+
+def held_out(tickets: pd.DataFrame, share: float = 0.2) -> pd.Series:
+    """Stable mask of the tickets kept out of training for the report, by a hash of their ID."""
+    hashes = tickets['ticket_id'].astype(str).map(lambda ticket_id: zlib.crc32(ticket_id.encode("utf-8")))
+    return (hashes % 1000) < share * 1000
+
+
+if __name__ == "__main__":
+    from database import JiraMockService
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "train"
+    tickets_file = sys.argv[2] if len(sys.argv) > 2 else "database/jira_tickets.csv"
+    model_file = sys.argv[3] if len(sys.argv) > 3 else default_model_file
+    jira = JiraMockService(tickets_file, auto_save=False)
+    if command == "train":
+        model = train(jira.iter_tickets(lambda chunk: chunk['status'] == 'Closed'))
+        model.save(model_file)
+        print(f"Trained on {model.category.trained_on} closed tickets, model {model.version} saved to {model_file}")
+    elif command == "report":
+        history = pd.concat(jira.iter_tickets(lambda chunk: chunk['status'] == 'Closed'), ignore_index=True)
+        test = held_out(history)
+        model = train(history[~test])
+        print(f"Trained on {(~test).sum()} closed tickets, tested on {test.sum()}")
+        print(accuracy_report(model, history[test]).to_string(index=False))
+    else:
+        sys.exit(__doc__)
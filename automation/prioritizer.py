@@ -1,32 +1,21 @@
-def predict_priority(summary: str, description: str, category: str = None) -> str:
-    # Priority mapping based on known categories
-    category_priority_map = {
-        "Software Issue": "Critical",
-        "Security": "Critical",
-        "Network Issue": "High",
-        "Access Management": "High",
-        "Monitoring": "High",
-        "System Performance": "Medium",
-        "Software": "Medium",
-        "Hardware": "Medium",
-        "Email": "Medium",
-        "Printing": "Low",
-        "User Support": "Low"
-    }
+from automation.cache import prediction_cache
+from automation.rules import RuleEngine, load_rules
+
+_rules = load_rules()["priority"]
+
+# Priority mapping based on known categories
+category_priority_map = _rules["category_map"]
+
+# Fallback keyword rules in evaluation order, used when the category is unknown
+priority_rules = [(rule["label"], rule["keywords"]) for rule in _rules["rules"]]
+default_priority = _rules["default"]
+priority_engine = RuleEngine(priority_rules, default_priority)
 
+
+def predict_priority(summary: str, description: str, category: str = None) -> str:
     if category and category in category_priority_map:
         return category_priority_map[category]
 
     # Fallback keyword-based rule if category is unknown
     text = f"{summary} {description}".lower()
-
-    if any(keyword in text for keyword in ["locked", "unauthorized", "authentication", "security"]):
-        return "Critical"
-    elif any(keyword in text for keyword in ["vpn", "network", "access denied", "timeout"]):
-        return "High"
-    elif any(keyword in text for keyword in ["slow", "performance", "update", "failure", "error"]):
-        return "Medium"
-    elif any(keyword in text for keyword in ["printer", "mouse", "keyboard", "request", "support"]):
-        return "Low"
-    else:
-        return "Medium"  # Default fallback
+    return prediction_cache.match(priority_engine, text)
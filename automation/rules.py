@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+rules_file = os.path.join(os.path.dirname(__file__), "rules.json")
+
+
+class RuleEngine:
+    """
+    Ordered keyword rules compiled once.
+
+    match() returns the label of the first rule (in rule order) with a keyword contained
+    in the text, like a cascade of `any(word in text for word in keywords)` checks.
+
+    For a single text the keywords are scanned once each in rule order, skipping any
+    keyword that contains another keyword of the same or an earlier rule; CPython's
+    substring search beats a regex pass over the text for a few dozen keywords.
+
+    For a batch all keywords are compiled into a single trie-shaped regex that returns
+    the longest keyword starting at a position. Every other keyword matching at that
+    position is a prefix of it, so each keyword is ranked with the earliest rule among
+    its prefixes and one pass over each text is enough to find the first rule.
+    """
+
+    def __init__(self, rules: list, default: str):
+        self.rules = [(label, list(keywords)) for label, keywords in rules]
+        self.default = default
+        # Fingerprint of the rule set, cached results are only reused for the same version
+        self.version = hashlib.sha256(json.dumps([self.rules, default]).encode("utf-8")).hexdigest()[:16]
+
+        first_rule = {}
+        for i, (_, keywords) in enumerate(self.rules):
+            for word in keywords:
+                first_rule.setdefault(word, i)
+        self._rank = {
+            word: min(rank for prefix, rank in first_rule.items() if word.startswith(prefix))
+            for word in first_rule
+        }
+        self.pattern = re.compile(_trie_pattern(first_rule))
+        self._overlapping = re.compile(f"(?=({self.pattern.pattern}))")
+
+        # Keywords to scan for, a keyword is dropped when a keyword it contains
+        # belongs to the same or an earlier rule
+        self._scan = [
+            (word, rank) for word, rank in sorted(first_rule.items(), key=lambda item: item[1])
+            if not any(other != word and other in word and first_rule[other] <= rank for other in first_rule)
+        ]
+
+    def match(self, text: str) -> str:
+        """Label of the first matching rule for an already lowercased text."""
+        for word, rank in self._scan:
+            if word in text:
+                return self.rules[rank][0]
+        return self.default
+
+    def match_series(self, text: pd.Series) -> pd.Series:
+        """Vectorized match over a Series of lowercased texts."""
+        if text.empty:
+            return pd.Series([], index=text.index, dtype=object)
+        labels = [
+            self.rules[min(self._rank[word] for word in words)][0] if words else self.default
+            for words in text.str.findall(self._overlapping)
+        ]
+        return pd.Series(labels, index=text.index, dtype=object)
+
+
+def load_rules(path: str = rules_file) -> dict:
+    """Load the keyword rules data file."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _trie_pattern(words) -> str:
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _trie_node_pattern(trie)
+
+
+def _trie_node_pattern(node: dict) -> str:
+    branches = [re.escape(char) + _trie_node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # A keyword ends here, longer keywords are tried first (greedy)
+        pattern = f"(?:{pattern})?"
+    return pattern
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from automation.batch import _ticket_text
+from automation.cache import prediction_cache
+from automation.prioritizer import priority_engine
+from automation.priority import priority_weights
+from monitoring import registry
+
+# Upper bounds in seconds of the time to assignment, from one fast pass to an hour behind a backlog
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _now() -> float:
+    # Naive local time read as UTC, the same way the naive created_at values are converted
+    return datetime.now().replace(tzinfo=timezone.utc).timestamp()
+
+
+def pre_scores(pending: pd.DataFrame) -> pd.Series:
+    """
+    Cheap priority weight of each pending ticket: its priority when already set, else the keyword
+    fallback of predict_priority on its text. Categories are not predicted for this.
+    """
+    priorities = pending['priority'].astype(object)
+    unknown = priorities.isnull()
+    if unknown.any():
+        text = _ticket_text(pending['summary'][unknown], pending['description'][unknown])
+        priorities[unknown] = prediction_cache.match_series(priority_engine, text)
+    return priorities.map(priority_weights).fillna(priority_weights['Medium']).astype(float)
+
+
+class TriageScheduler:
+    """
+    Queue of the tickets waiting for triage, most urgent first.
+
+    A ticket's rank is its pre-score (see pre_scores) plus one level per aging seconds of waiting, so a Low
+    ticket overtakes a fresh Critical one after waiting 3 * aging seconds. The wait counts from the ticket's
+    creation, or from the scheduler's start for older tickets, and from when it is queued again for a ticket
+    triaged before (reopened or unassigned since). Every ticket ages at the same rate, so the rank
+    boils down to the fixed key start of the wait - weight * aging and the min-heap never needs reordering.
+    Pushing a queued ticket again updates its key, superseded heap entries are skipped lazily.
+
+    Time to assignment, over the same wait, is recorded per final priority into
+    ticket_watcher_time_to_assignment_seconds.
+    """
+
+    def __init__(self, aging: float = 3600, metrics=registry):
+        self.aging = aging
+        self.metrics = metrics
+        self.started = _now()
+        self._heap = []
+        self._counter = itertools.count()
+        # ticket_id -> current key, and -> when its wait started
+        self._queued = {}
+        self._since = {}
+        # Tickets triaged before, their creation no longer tells when their current wait started
+        self._assigned = set()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def push(self, pending: pd.DataFrame):
+        """Queue the pending tickets, or update their rank when already queued."""
+        if pending.empty:
+            return
+        now = _now()
+        created = pd.to_datetime(pending['created_at'], errors='coerce', format='ISO8601')
+        # Tickets older than the scheduler, an import for instance, all count from its start
+        since = (created - pd.Timestamp(0)).dt.total_seconds().fillna(now).clip(lower=self.started)
+        if self._assigned:
+            since = since.mask(pending['ticket_id'].isin(self._assigned), now)
+        keys = since - pre_scores(pending) * self.aging
+        for ticket_id, key, waiting_since in zip(pending['ticket_id'], keys.tolist(), since.tolist()):
+            if self._queued.get(ticket_id) == key:
+                continue
+            self._queued[ticket_id] = key
+            self._since.setdefault(ticket_id, waiting_since)
+            heapq.heappush(self._heap, (key, next(self._counter), ticket_id))
+
+    def pop(self, count: int = None) -> list:
+        """Up to count of the most urgent tickets (all of them by default), removed from the queue."""
+        ticket_ids = []
+        while self._heap and (count is None or len(ticket_ids) < count):
+            key, _, ticket_id = heapq.heappop(self._heap)
+            if self._queued.get(ticket_id) == key:
+                del self._queued[ticket_id]
+                ticket_ids.append(ticket_id)
+        return ticket_ids
+
+    def assigned(self, priorities: dict):
+        """Record the time to assignment of triaged tickets, given as ticket_id -> final priority."""
+        now = _now()
+        histograms = {}
+        for ticket_id, priority in priorities.items():
+            self._assigned.add(ticket_id)
+            since = self._since.pop(ticket_id, None)
+            if since is None:
+                continue
+            if priority not in histograms:
+                histograms[priority] = self.metrics.histogram('ticket_watcher_time_to_assignment_seconds',
+                                                              buckets=latency_buckets, priority=priority)
+            histograms[priority].observe(now - since)
+
+    def forget(self, ticket_ids):
+        """Drop popped tickets that no longer need triage."""
+        for ticket_id in ticket_ids:
+            self._since.pop(ticket_id, None)
+
+    def latency(self) -> dict:
+        """Priority -> count, p50 and p99 of the time to assignment, in seconds."""
+        report = {}
+        for priority in priority_weights:
+            histogram = self.metrics.histogram('ticket_watcher_time_to_assignment_seconds', buckets=latency_buckets,
+                                               priority=priority)
+            if histogram.count:
+                report[priority] = {'count': histogram.count, 'p50': histogram.quantile(0.5),
+                                    'p99': histogram.quantile(0.99)}
+        return report
@@ -0,0 +1,83 @@
+import heapq
+from typing import Iterable
+
+import pandas as pd
+
+from automation.priority import priority_weights
+
+active_statuses = ['Open', 'In Progress', 'Waiting for User']
+
+
+class WorkloadTracker:
+    """
+    Priority-weighted workload per assignee, kept up to date incrementally.
+
+    Loads live in a min-heap keyed on (load, assignee order), so picking the least loaded
+    assignee and recording a change both cost O(log U). Ties go to the assignee listed
+    first, like min() over the workload dict. Superseded heap entries are skipped lazily.
+    """
+
+    def __init__(self, assignees: Iterable[str]):
+        self._order = {name: i for i, name in enumerate(dict.fromkeys(assignees))}
+        self._load = dict.fromkeys(self._order, 0)
+        self._tickets = {}
+        self._rebuild_heap()
+
+    @classmethod
+    def from_tickets(cls, tickets: pd.DataFrame, assignees: Iterable[str], statuses=active_statuses):
+        """
+        Seed a tracker from the assigned tickets in the given statuses (all tickets when statuses is None).
+        """
+        tracker = cls(assignees)
+        if statuses is not None:
+            tickets = tickets[tickets['status'].isin(statuses)]
+        tickets = tickets[~tickets['assignee'].isnull()]
+        for ticket_id, assignee, priority in zip(tickets['ticket_id'], tickets['assignee'], tickets['priority']):
+            if assignee in tracker._load:
+                weight = priority_weights.get(priority, 2)
+                tracker._tickets[ticket_id] = (assignee, weight)
+                tracker._load[assignee] += weight
+        tracker._rebuild_heap()
+        return tracker
+
+    def load(self, assignee: str):
+        """Current workload of an assignee."""
+        return self._load[assignee]
+
+    def next_assignee(self) -> str:
+        """Assignee with the lowest current workload."""
+        heap = self._heap
+        while heap:
+            load, _, name = heap[0]
+            if self._load[name] == load:
+                return name
+            heapq.heappop(heap)
+        raise ValueError("No assignees available")
+
+    def update(self, ticket_id, assignee, priority, status='Open'):
+        """
+        Record the current state of a ticket: assigned, re-prioritized or moved out of the active statuses.
+        """
+        self.remove(ticket_id)
+        if status in active_statuses and assignee in self._load:
+            weight = priority_weights.get(priority, 2)
+            self._tickets[ticket_id] = (assignee, weight)
+            self._set_load(assignee, self._load[assignee] + weight)
+
+    def remove(self, ticket_id):
+        """Stop counting a ticket."""
+        previous = self._tickets.pop(ticket_id, None)
+        if previous:
+            assignee, weight = previous
+            self._set_load(assignee, self._load[assignee] - weight)
+
+    def _set_load(self, assignee: str, load):
+        self._load[assignee] = load
+        heapq.heappush(self._heap, (load, self._order[assignee], assignee))
+        # Stale entries pile up between pops, start over once they dominate
+        if len(self._heap) > 4 * len(self._load) + 16:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(load, self._order[name], name) for name, load in self._load.items()]
+        heapq.heapify(self._heap)
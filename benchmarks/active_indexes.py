@@ -0,0 +1,99 @@
+"""
+Cost of the watcher's full passes as the closed history grows, with a fixed number of active tickets.
+
+Compares scanning the whole table (what the passes did before the service kept status, triage and
+assignee indexes) with reading the indexes, and reports what keeping the indexes adds to an update.
+
+Usage: python -m benchmarks.active_indexes [active tickets] [history sizes ...]
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import main
+from automation import WorkloadTracker
+from benchmarks.synthetic import generate_ticket_frame
+from benchmarks.triage_batch import users_file
+from database import JiraMockService
+from notifications.summary_email import summarized_tickets
+
+repeat = 5
+
+
+def best_of(run) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def scan_pass(jira: JiraMockService):
+    """The passes over the whole table."""
+    _, tickets, users = jira.snapshot()
+    WorkloadTracker.from_tickets(tickets, users['name'])
+    pending = tickets[(tickets['status'] == 'Open') & (
+        tickets['category'].isnull() | tickets['priority'].isnull() | tickets['assignee'].isnull())]
+    summarized_tickets(tickets)
+    return pending
+
+
+def indexed_pass(watcher: main.TicketWatcher):
+    """The watcher's own full passes, reading the indexes."""
+    users = watcher.jira.get_all_users()
+    watcher._watch_version = watcher._notify_version = None
+    pending = watcher._collect_pending(users)
+    watcher._assignees_to_notify()
+    return pending
+
+
+def update_seconds(jira: JiraMockService, ticket_ids: list) -> float:
+    start = time.perf_counter()
+    for i, ticket_id in enumerate(ticket_ids):
+        jira.update_ticket(ticket_id, {'status': 'In Progress' if i % 2 else 'Open'})
+    return (time.perf_counter() - start) / len(ticket_ids)
+
+
+def main_benchmark(active: int, history_sizes: list[int]):
+    workdir = tempfile.mkdtemp()
+    try:
+        print(f"{active} active tickets")
+        print(f"{'closed':>9} {'scan ms':>8} {'indexed ms':>11} {'speedup':>8} {'update us':>10} {'unindexed us':>13}")
+        for history in history_sizes:
+            tickets = pd.concat([
+                generate_ticket_frame(active, status_mix={'Open': 0.6, 'In Progress': 0.3, 'Waiting for User': 0.1}),
+                generate_ticket_frame(history, seed=8, status_mix={'Closed': 0.9, 'Resolved': 0.1}),
+            ], ignore_index=True)
+            tickets['ticket_id'] = [f"TKT-{i:04d}" for i in range(1, len(tickets) + 1)]
+            tickets_file = os.path.join(workdir, "tickets.csv")
+            tickets.to_csv(tickets_file, index=False)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                jira = JiraMockService(tickets_file, users_file, auto_save=False)
+                watcher = main.TicketWatcher(jira=jira)
+            pd.testing.assert_frame_equal(indexed_pass(watcher), scan_pass(jira))
+            scan = best_of(lambda: scan_pass(jira))
+            indexed = best_of(lambda: indexed_pass(watcher))
+
+            ticket_ids = list(tickets['ticket_id'][:1000])
+            indexed_update = update_seconds(jira, ticket_ids)
+            indexes, jira.tickets_service.indexes = jira.tickets_service.indexes, []
+            unindexed_update = update_seconds(jira, ticket_ids)
+            jira.tickets_service.indexes = indexes
+
+            print(f"{history:>9} {scan * 1000:>8.1f} {indexed * 1000:>11.1f} {scan / indexed:>7.1f}x "
+                  f"{indexed_update * 1e6:>10.0f} {unindexed_update * 1e6:>13.0f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+                   [int(n) for n in sys.argv[2:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,77 @@
+"""
+Throughput of emailing summaries to thousands of recipients through the local SMTP stand-in.
+
+- one connection per email: connect, EHLO, send, QUIT for every message, what a naive loop does
+- pooled: EmailDispatcher over an SMTPPool of 1, 4 and 8 persistent connections
+- unchanged: the same summaries submitted again, coalesced without sending anything
+- 5% failures: the server refuses 5% of the messages with a 451, all must arrive through retries
+
+The server waits delay seconds before every reply, like a remote server would.
+
+Usage: python -m benchmarks.email_dispatch [recipients] [delay ms]
+"""
+import smtplib
+import sys
+import time
+
+from notifications.dispatch import EmailDispatcher, SMTPPool, build_message
+from notifications.local_smtp import LocalSMTPServer
+from notifications.summary_email import render_summary_html, summary_subject
+
+sender = "it-support@localhost"
+
+
+def summaries(count: int) -> dict:
+    rows = [(f"TKT-{i:04d}", "Laptop slow since this morning", "Open", "", "System Performance", "Medium")
+            for i in range(5)]
+    return {f"user{i}": render_summary_html(f"user{i}", rows) for i in range(count)}
+
+
+def one_connection_per_email(server: LocalSMTPServer, emails: dict) -> float:
+    start = time.perf_counter()
+    for name, html in emails.items():
+        recipient = f"{name}@localhost"
+        with smtplib.SMTP("127.0.0.1", server.port) as connection:
+            connection.sendmail(sender, [recipient], build_message(sender, recipient, summary_subject, html))
+    return time.perf_counter() - start
+
+
+def dispatch(dispatcher: EmailDispatcher, emails: dict) -> float:
+    start = time.perf_counter()
+    for name, html in emails.items():
+        dispatcher.submit(name, f"{name}@localhost", summary_subject, html)
+    dispatcher.flush()
+    return time.perf_counter() - start
+
+
+def main(count: int, delay: float):
+    emails = summaries(count)
+    print(f"{count} recipients, {delay * 1000:.1f} ms per server reply")
+    print(f"{'mode':>26} {'seconds':>8} {'emails/s':>9} {'delivered':>10} {'connections':>12}")
+
+    def report(mode, seconds, server, delivered_before=0, connections_before=0):
+        delivered = len(server.messages) - delivered_before
+        print(f"{mode:>26} {seconds:>8.2f} {count / seconds:>9.0f} {delivered:>10} "
+              f"{server.connections - connections_before:>12}")
+
+    with LocalSMTPServer(delay=delay) as server:
+        report("one connection per email", one_connection_per_email(server, emails), server)
+
+    for size in (1, 4, 8):
+        with LocalSMTPServer(delay=delay) as server:
+            dispatcher = EmailDispatcher(SMTPPool("127.0.0.1", server.port, size=size), sender)
+            report(f"pooled, {size} connection(s)", dispatch(dispatcher, emails), server)
+            delivered, connections = len(server.messages), server.connections
+            report("  unchanged, again", dispatch(dispatcher, emails), server, delivered, connections)
+            dispatcher.close()
+
+    with LocalSMTPServer(delay=delay, failure_rate=0.05, seed=1) as server:
+        dispatcher = EmailDispatcher(SMTPPool("127.0.0.1", server.port, size=4), sender, backoff=0.01)
+        seconds = dispatch(dispatcher, emails)
+        report("pooled 4, 5% failures", seconds, server)
+        assert len({recipients[0] for _, recipients, _ in server.messages}) == count
+        dispatcher.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0005)
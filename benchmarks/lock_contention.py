@@ -0,0 +1,67 @@
+"""
+Measures how long triage waits while a slow notification run is in progress.
+
+Runs a TicketWatcher whose summary rendering takes several seconds, keeps creating tickets
+during the render and reports how long each one takes to be assigned. Fails when triage
+stalls for about as long as the render.
+
+Usage: python -m benchmarks.lock_contention [render seconds]
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import main
+from benchmarks.triage_batch import generate_tickets, users_file
+from database import JiraMockService
+
+interval = 0.05
+
+
+def main_benchmark(render_seconds: float):
+    workdir = tempfile.mkdtemp()
+    rendering = []
+
+    def slow_summary(tickets, assignees=None, **kwargs):
+        rendering.append(time.perf_counter())
+        time.sleep(render_seconds)
+
+    original = main.summary_tickets_email
+    main.summary_tickets_email = slow_summary
+    try:
+        tickets_file = os.path.join(workdir, "tickets.csv")
+        generate_tickets(2000).to_csv(tickets_file, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            jira = JiraMockService(tickets_file, users_file)
+            watcher = main.TicketWatcher(interval=interval, notification_mail_interval=interval, jira=jira)
+            watcher.start()
+
+            while not rendering:
+                time.sleep(0.01)
+            # Tickets created while the notifier is busy rendering
+            latencies = []
+            while time.perf_counter() - rendering[0] < render_seconds * 0.8:
+                created = time.perf_counter()
+                ticket = jira.create_ticket({'summary': "VPN timeout", 'description': "Cannot connect", 'assignee': None})
+                while not isinstance(jira.find_ticket_by_id(ticket['ticket_id'])['assignee'], str):
+                    time.sleep(0.005)
+                latencies.append(time.perf_counter() - created)
+
+            watcher.stop()
+    finally:
+        main.summary_tickets_email = original
+        shutil.rmtree(workdir)
+
+    latencies.sort()
+    print(f"render {render_seconds:.1f}s, triage interval {interval}s, {len(latencies)} tickets created during the render")
+    print(f"time to assignment: p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"max {latencies[-1] * 1000:.0f} ms")
+    assert latencies[-1] < render_seconds / 2, "triage waited for the notifier"
+
+
+if __name__ == "__main__":
+    main_benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 3.0)
@@ -0,0 +1,210 @@
+"""
+Times every stage of one triage pass over a synthetic ticket table and writes the results as JSON.
+
+Stages: load, filter, categorize, prioritize, assign, persist and render, each with its
+duration, throughput and peak resident memory. Results files of two commits can be compared
+with --compare.
+
+Usage: python -m benchmarks.pipeline [--tickets N ...] [--storage ENGINE] [--status-mix Open=0.1,Closed=0.9]
+                                     [--summary-words N] [--description-words N] [--output FILE] [--compare FILE]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from automation.batch import predict_categories, predict_priorities
+from automation.workload import WorkloadTracker
+from benchmarks.storage_formats import memory_mb
+from benchmarks.synthetic import default_status_mix, generate_ticket_frame
+from benchmarks.triage_batch import users_file
+from database import JiraMockService
+from database.convert_storage import convert_storage
+from notifications.summary_email import SummaryRenderer, summarized_tickets
+
+stages = ['load', 'filter', 'categorize', 'prioritize', 'assign', 'persist', 'render']
+
+
+def reset_peak_memory():
+    """Reset VmHWM so the next reading is the peak of the coming stage only (Linux)."""
+    with contextlib.suppress(OSError):
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+
+
+class StageTimer:
+    """Collects duration, throughput and memory of the stages of one run."""
+
+    def __init__(self):
+        self.results = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, tickets: int):
+        reset_peak_memory()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+        seconds = time.perf_counter() - start
+        self.results[name] = {
+            'seconds': seconds,
+            'tickets': tickets,
+            'tickets_per_s': tickets / seconds if seconds else None,
+            'peak_mb': memory_mb("VmHWM"),
+            'resident_mb': memory_mb("VmRSS"),
+        }
+
+
+def run_pipeline(count: int, storage: str = 'csv', status_mix: dict = None, summary_words: int = 3,
+                 description_words: int = 5, seed: int = 7) -> dict:
+    """
+    Runs one triage pass over count synthetic tickets, stage by stage. Returns the stage results.
+
+    The stages are the building blocks of TicketWatcher's batch pass (triage_batch split up
+    so categorize, prioritize and assign can be timed apart) followed by the summary render.
+    """
+    workdir = tempfile.mkdtemp()
+    try:
+        tickets_file = os.path.join(workdir, "jira_tickets.csv")
+        shutil.copy(users_file, os.path.join(workdir, "jira_users.csv"))
+        generate_ticket_frame(count, seed, status_mix, summary_words, description_words).to_csv(tickets_file,
+                                                                                                 index=False)
+        if storage not in ('csv', 'log'):
+            with contextlib.redirect_stdout(io.StringIO()):
+                convert_storage(storage, 'csv', tickets_file, os.path.join(workdir, "jira_users.csv"))
+
+        timer = StageTimer()
+        with timer.stage('load', count):
+            jira = JiraMockService(tickets_file, os.path.join(workdir, "jira_users.csv"), auto_save=False,
+                                   storage=storage)
+
+        version, tickets, users = jira.snapshot()
+        with timer.stage('filter', len(tickets)):
+            pending = tickets[
+                (tickets['status'] == 'Open') &
+                (tickets['category'].isnull() | tickets['priority'].isnull() | tickets['assignee'].isnull())
+            ]
+            result = pending[['ticket_id', 'category', 'priority', 'assignee']].astype(object)
+
+        missing = result['category'].isnull()
+        with timer.stage('categorize', int(missing.sum())):
+            if missing.any():
+                result.loc[missing, 'category'] = predict_categories(pending['summary'][missing],
+                                                                     pending['description'][missing])
+
+        missing = result['priority'].isnull()
+        with timer.stage('prioritize', int(missing.sum())):
+            if missing.any():
+                result.loc[missing, 'priority'] = predict_priorities(pending['summary'][missing],
+                                                                     pending['description'][missing],
+                                                                     result['category'][missing])
+
+        with timer.stage('assign', len(result)):
+            workload = WorkloadTracker.from_tickets(tickets, users['name'])
+            assignees = []
+            for ticket_id, status, assignee, priority in zip(result['ticket_id'], pending['status'],
+                                                             result['assignee'], result['priority']):
+                if pd.isnull(assignee):
+                    assignee = workload.next_assignee()
+                workload.update(ticket_id, assignee, priority, status)
+                assignees.append(assignee)
+            result['assignee'] = assignees
+
+        with timer.stage('persist', len(result)):
+            jira.update_tickets(result.set_index('ticket_id').to_dict(orient='index'), unchanged_since=version)
+            jira.save()
+
+        tickets = jira.get_all_tickets()
+        renderer = SummaryRenderer(output_dir=os.path.join(workdir, "summaries"))
+        with timer.stage('render', len(summarized_tickets(tickets))):
+            renderer.render(tickets)
+        renderer.close()
+
+        return timer.results
+    finally:
+        shutil.rmtree(workdir)
+
+
+def current_commit():
+    """Short hash of the checked out commit, None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_run(run: dict, baseline: dict = None):
+    print(f"{run['tickets']} tickets, storage {run['storage']}")
+    print(f"{'stage':>12} {'tickets':>9} {'seconds':>9} {'tickets/s':>12} {'peak MB':>9}"
+          + (f" {'vs baseline':>12}" if baseline else ""))
+    for name in stages:
+        stage = run['stages'][name]
+        line = (f"{name:>12} {stage['tickets']:>9} {stage['seconds']:>9.3f} {stage['tickets_per_s'] or 0:>12.0f} "
+                f"{stage['peak_mb']:>9.0f}")
+        if baseline and baseline['stages'].get(name, {}).get('seconds'):
+            line += f" {stage['seconds'] / baseline['stages'][name]['seconds']:>11.2f}x"
+        print(line)
+
+
+def parse_status_mix(value: str) -> dict:
+    """"Open=0.1,Closed=0.9" -> {'Open': 0.1, 'Closed': 0.9}"""
+    return {status.strip(): float(share) for status, share in (item.split("=") for item in value.split(","))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage timings of the triage pipeline.")
+    parser.add_argument("--tickets", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--storage", default='csv')
+    parser.add_argument("--status-mix", type=parse_status_mix, default=default_status_mix)
+    parser.add_argument("--summary-words", type=int, default=3)
+    parser.add_argument("--description-words", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="pipeline_results.json")
+    parser.add_argument("--compare", help="Results file of an earlier run, printed side by side")
+    args = parser.parse_args()
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baselines = {(run['tickets'], run['storage']): run for run in json.load(f)['runs']}
+
+    results = {
+        'commit': current_commit(),
+        'date': datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'parameters': {
+            'storage': args.storage,
+            'status_mix': args.status_mix,
+            'summary_words': args.summary_words,
+            'description_words': args.description_words,
+            'seed': args.seed,
+        },
+        'runs': [],
+    }
+    for count in args.tickets:
+        run = {
+            'tickets': count,
+            'storage': args.storage,
+            'stages': run_pipeline(count, args.storage, args.status_mix, args.summary_words,
+                                   args.description_words, args.seed),
+        }
+        results['runs'].append(run)
+        print_run(run, baselines.get((count, args.storage)))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
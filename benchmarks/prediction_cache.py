@@ -0,0 +1,51 @@
+"""
+Per-ticket and batch predictions with and without the prediction cache, on a stream that repeats
+a few templates like JiraMockService.initializeData does, and on unique texts.
+
+Usage: python -m benchmarks.prediction_cache [tickets] [templates]
+"""
+import random
+import sys
+import time
+
+import pandas as pd
+
+from automation import predict_category, predict_priority, prediction_cache
+from automation.batch import predict_categories, predict_priorities
+from benchmarks.rule_engine import generate_texts
+
+
+def per_ticket(texts: list[str]) -> float:
+    start = time.perf_counter()
+    for text in texts:
+        predict_priority(text, "", predict_category(text, ""))
+    return time.perf_counter() - start
+
+
+def batch(texts: list[str]) -> float:
+    summaries = pd.Series(texts, dtype=object)
+    descriptions = pd.Series([""] * len(texts), dtype=object)
+    start = time.perf_counter()
+    predict_priorities(summaries, descriptions, predict_categories(summaries, descriptions))
+    return time.perf_counter() - start
+
+
+def main(count: int, templates: int):
+    rng = random.Random(5)
+    streams = {
+        f"{templates} templates": [rng.choice(generate_texts(40, templates, random.Random(1))) for _ in range(count)],
+        "unique": generate_texts(40, count, rng),
+    }
+    print(f"{'stream':>14} {'path':>10} {'no cache s':>11} {'cached s':>9} {'hit rate':>9}")
+    for name, texts in streams.items():
+        for path, run in (("per-ticket", per_ticket), ("batch", batch)):
+            prediction_cache.maxsize = 0
+            uncached = run(texts)
+            prediction_cache.maxsize = 100_000
+            prediction_cache.clear()
+            cached = run(texts)
+            print(f"{name:>14} {path:>10} {uncached:>11.3f} {cached:>9.3f} {prediction_cache.stats()['hit_rate']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
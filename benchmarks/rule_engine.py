@@ -0,0 +1,97 @@
+"""
+Compares the compiled rule engine with the original keyword cascades.
+
+Usage: python -m benchmarks.rule_engine [texts per length]
+"""
+import random
+import sys
+import time
+
+from automation import predict_category, predict_priority, prediction_cache
+from automation.categorizer import category_rules
+from automation.prioritizer import priority_rules
+
+words = ("the user reports that machine after reboot morning team floor ticket laptop screen black despite "
+         "power supply is not working since yesterday when we tried again with colleague from finance "
+         "department it still shows same message please help urgently").split()
+keywords = [word for _, rule_words in category_rules + priority_rules for word in rule_words]
+lengths = [10, 50, 200, 1000, 5000]
+
+
+# Original implementations, kept as the reference for results and timings
+def cascade_category(summary, description):
+    text = f"{summary} {description}".lower()
+    if any(word in text for word in ['application', 'error', 'exception']):
+        return 'Software Issue'
+    if any(word in text for word in ["vpn", "network", "connection timeout"]):
+        return "Network Issue"
+    elif any(word in text for word in ["printer", "keyboard", "mouse", "monitor", "hardware"]):
+        return "Hardware"
+    elif any(word in text for word in ["software", "install", "update", "failure"]):
+        return "Software"
+    elif any(word in text for word in ["access", "admin", "privileges", "permission"]):
+        return "Access Management"
+    elif any(word in text for word in ["password", "locked", "login", "authentication"]):
+        return "Security"
+    elif any(word in text for word in ["slow", "performance", "cpu", "overheating"]):
+        return "System Performance"
+    elif any(word in text for word in ["email", "outlook", "missing email"]):
+        return "Email"
+    elif any(word in text for word in ["print", "printing"]):
+        return "Printing"
+    elif any(word in text for word in ["monitoring", "bsod", "error"]):
+        return "Monitoring"
+    else:
+        return "User Support"
+
+
+def cascade_priority(summary, description):
+    text = f"{summary} {description}".lower()
+    if any(keyword in text for keyword in ["locked", "unauthorized", "authentication", "security"]):
+        return "Critical"
+    elif any(keyword in text for keyword in ["vpn", "network", "access denied", "timeout"]):
+        return "High"
+    elif any(keyword in text for keyword in ["slow", "performance", "update", "failure", "error"]):
+        return "Medium"
+    elif any(keyword in text for keyword in ["printer", "mouse", "keyboard", "request", "support"]):
+        return "Low"
+    else:
+        return "Medium"
+
+
+def generate_texts(length: int, count: int, rng: random.Random) -> list[str]:
+    texts = []
+    for _ in range(count):
+        text = [rng.choice(words) for _ in range(length)]
+        # Keywords glued to other words and each other, e.g. "printerror", to exercise overlaps
+        for _ in range(rng.randint(0, 2)):
+            text.insert(rng.randrange(len(text) + 1), rng.choice(keywords) + rng.choice(["", rng.choice(keywords)]))
+        texts.append(" ".join(text).capitalize())
+    return texts
+
+
+def timed(func, texts: list[str]) -> float:
+    start = time.perf_counter()
+    for text in texts:
+        func(text, "")
+    return (time.perf_counter() - start) / len(texts) * 1e6
+
+
+def main(count: int):
+    # Times the rule engine itself, see benchmarks.prediction_cache for the cache
+    prediction_cache.maxsize = 0
+    rng = random.Random(11)
+    print(f"{'words':>6} {'category us':>24} {'priority us':>24}")
+    for length in lengths:
+        texts = generate_texts(length, count, rng)
+        for text in texts:
+            assert predict_category(text, "") == cascade_category(text, ""), text
+            assert predict_priority(text, "") == cascade_priority(text, ""), text
+
+        category = f"{timed(cascade_category, texts):.1f} -> {timed(predict_category, texts):.1f}"
+        priority = f"{timed(cascade_priority, texts):.1f} -> {timed(predict_priority, texts):.1f}"
+        print(f"{length:>6} {category:>24} {priority:>24}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
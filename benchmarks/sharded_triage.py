@@ -0,0 +1,47 @@
+"""
+Triage throughput with categorization and prioritization sharded over 1, 2, 4 and 8 worker processes.
+
+Every run must give the same result as the in-process batch triage. Pools are started and
+warmed up before timing, so the figures are steady-state throughput.
+
+Usage: python -m benchmarks.sharded_triage [tickets] [workers ...]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from automation import triage_batch
+from automation.batch import classify_chunk
+from benchmarks.synthetic import generate_ticket_frame
+from benchmarks.triage_batch import users_file
+
+
+def main(count: int, worker_counts: list[int]):
+    # Everything untriaged, with longer descriptions so classification dominates
+    pending = generate_ticket_frame(count, status_mix={'Open': 1}, description_words=20)
+    users = pd.read_csv(users_file, dtype=object)
+
+    start = time.perf_counter()
+    expected = triage_batch(pending, pending, users)
+    baseline = time.perf_counter() - start
+    print(f"{count} tickets on {os.cpu_count()} CPU(s)")
+    print(f"{'workers':>8} {'seconds':>9} {'tickets/s':>11} {'speedup':>8}")
+    print(f"{'local':>8} {baseline:>9.2f} {count / baseline:>11.0f} {1:>7.2f}x")
+
+    for workers in worker_counts:
+        with ProcessPoolExecutor(workers) as executor:
+            # Start the workers and import the rules before timing
+            list(executor.map(classify_chunk, [["warm up"]] * workers, [[""]] * workers, [[None]] * workers,
+                              [[None]] * workers))
+            start = time.perf_counter()
+            result = triage_batch(pending, pending, users, executor=executor, chunk_size=max(count // (4 * workers), 1))
+            seconds = time.perf_counter() - start
+        pd.testing.assert_frame_equal(result.fillna("-"), expected.fillna("-"))
+        print(f"{workers:>8} {seconds:>9.2f} {count / seconds:>11.0f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000, [int(n) for n in sys.argv[2:]] or [1, 2, 4, 8])
@@ -0,0 +1,75 @@
+"""
+Load time and resident memory of the ticket table per storage engine.
+
+Each load runs in a fresh interpreter so memory figures are not polluted by earlier runs.
+
+Usage: python -m benchmarks.storage_formats [tickets] [engine ...]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_ticket_frame
+
+ticket_columns = ['ticket_id', 'summary', 'description', 'status', 'assignee', 'created_at', 'category', 'priority']
+categorical = ['status', 'category', 'priority', 'assignee']
+
+
+def memory_mb(field: str) -> float:
+    """VmRSS (resident now) or VmHWM (peak resident) of this process, from /proc on Linux."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def load(engine: str, tickets_file: str):
+    """Runs in the child process: load the table and print the measurements as JSON."""
+    from database.EntityService import EntityService
+
+    before = memory_mb("VmRSS")
+    start = time.perf_counter()
+    service = EntityService(tickets_file, ticket_columns, 'ticket_id', 'TKT', engine, categorical=categorical)
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        'rows': len(service.data),
+        'seconds': seconds,
+        'resident_mb': memory_mb("VmRSS") - before,
+        'peak_mb': memory_mb("VmHWM") - before,
+    }))
+
+
+def main(count: int, engines: list[str]):
+    from database.convert_storage import convert_storage
+
+    workdir = tempfile.mkdtemp()
+    try:
+        tickets_file = os.path.join(workdir, "jira_tickets.csv")
+        users_file = os.path.join(workdir, "jira_users.csv")
+        generate_ticket_frame(count).to_csv(tickets_file, index=False)
+        shutil.copy(os.path.join(os.path.dirname(__file__), "..", "database", "jira_users.csv"), users_file)
+        for engine in engines:
+            if engine not in ('csv', 'log'):
+                convert_storage(engine, 'csv', tickets_file, users_file)
+
+        print(f"{'engine':>12} {'rows':>9} {'load s':>8} {'resident MB':>12} {'peak MB':>9}")
+        for engine in engines:
+            output = subprocess.run([sys.executable, "-m", "benchmarks.storage_formats", "--load", engine, tickets_file],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{engine:>12} {result['rows']:>9} {result['seconds']:>8.2f} {result['resident_mb']:>12.0f} "
+                  f"{result['peak_mb']:>9.0f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--load":
+        load(sys.argv[2], sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000, sys.argv[2:] or ['csv', 'feather'])
@@ -0,0 +1,82 @@
+"""
+Resident memory of the watcher's tables with and without the Closed ticket archive, and the
+throughput of streaming every ticket out through export_tickets.
+
+Each load runs in a fresh interpreter so memory figures are not polluted by earlier runs.
+
+Usage: python -m benchmarks.streaming [tickets] [storage]
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.storage_formats import memory_mb
+from benchmarks.synthetic import generate_ticket_frame
+
+
+def load(storage: str, archive_closed: bool, tickets_file: str, users_file: str):
+    """Runs in the child process: load, export, print the measurements as JSON."""
+    from database import JiraMockService
+
+    before = memory_mb("VmRSS")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        jira = JiraMockService(tickets_file, users_file, auto_save=False, storage=storage,
+                               archive_closed=archive_closed)
+    load_seconds = time.perf_counter() - start
+    resident_mb = memory_mb("VmRSS") - before
+
+    start = time.perf_counter()
+    exported = jira.export_tickets(os.path.join(os.path.dirname(tickets_file), "export.csv"))
+    export_seconds = time.perf_counter() - start
+    print(json.dumps({
+        'resident_rows': len(jira.get_all_tickets()),
+        'load_seconds': load_seconds,
+        'resident_mb': resident_mb,
+        'exported': exported,
+        'export_seconds': export_seconds,
+        'peak_mb': memory_mb("VmHWM") - before,
+    }))
+
+
+def main(count: int, storage: str):
+    workdir = tempfile.mkdtemp()
+    try:
+        tickets_file = os.path.join(workdir, "jira_tickets.csv")
+        users_file = os.path.join(workdir, "jira_users.csv")
+        shutil.copy(os.path.join(os.path.dirname(__file__), "..", "database", "jira_users.csv"), users_file)
+
+        print(f"{count} tickets, storage {storage}")
+        print(f"{'mode':>16} {'resident rows':>14} {'load s':>7} {'resident MB':>12} {'export s':>9} "
+              f"{'rows/s':>9} {'peak MB':>8}")
+        # Fresh table each time for the full load, the archive is paged out on the first load and reused after
+        for mode, archive_closed, fresh in (("in memory", False, True), ("archive, first", True, True),
+                                            ("archive, reload", True, False)):
+            if fresh:
+                for name in os.listdir(workdir):
+                    if name.startswith("jira_tickets") or name == "export.csv":
+                        os.remove(os.path.join(workdir, name))
+                generate_ticket_frame(count).to_csv(tickets_file, index=False)
+            output = subprocess.run([sys.executable, "-m", "benchmarks.streaming", "--load", storage,
+                                     str(archive_closed), tickets_file, users_file],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            assert result['exported'] == count, result
+            print(f"{mode:>16} {result['resident_rows']:>14} {result['load_seconds']:>7.2f} "
+                  f"{result['resident_mb']:>12.0f} {result['export_seconds']:>9.2f} "
+                  f"{count / result['export_seconds']:>9.0f} {result['peak_mb']:>8.0f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--load":
+        load(sys.argv[2], sys.argv[3] == "True", sys.argv[4], sys.argv[5])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000, sys.argv[2] if len(sys.argv) > 2 else 'csv')
@@ -0,0 +1,64 @@
+"""
+Vectorized synthetic ticket tables, fast enough for millions of rows.
+"""
+import numpy as np
+import pandas as pd
+
+from automation.categorizer import category_rules
+from automation.prioritizer import priority_rules
+
+assignees = ["Alice", "Bob", "Charlie", "Diana", "Eric", "Fernando", "Vivek", "Paul", "Conor"]
+filler = ["user", "reports", "the", "machine", "after", "reboot", "morning", "team", "floor", "ticket"]
+keywords = [word for _, words in category_rules + priority_rules for word in words]
+categories = [label for label, _ in category_rules]
+priorities = [label for label, _ in priority_rules]
+
+
+default_status_mix = {"Open": 0.06, "In Progress": 0.03, "Waiting for User": 0.01, "Resolved": 0.04, "Closed": 0.86}
+
+
+def generate_ticket_frame(count: int, seed: int = 7, status_mix: dict = None, summary_words: int = 3,
+                          description_words: int = 5) -> pd.DataFrame:
+    """
+    Ticket table with mostly Closed history and a few percent of untriaged Open tickets.
+
+    Parameters:
+        count: Number of tickets.
+        seed: Seed of the random generator, the same arguments give the same table.
+        status_mix: Status -> share of the tickets, normalized. Open tickets are left untriaged.
+        summary_words, description_words: Text length, in words drawn from filler and rule keywords.
+    """
+    rng = np.random.default_rng(seed)
+    status_mix = status_mix if status_mix else default_status_mix
+    statuses = np.array(list(status_mix), dtype=object)
+    shares = np.array(list(status_mix.values()), dtype=float)
+    status = statuses[rng.choice(len(statuses), size=count, p=shares / shares.sum())]
+    triaged = status != "Open"
+
+    vocabulary = np.array(filler + keywords, dtype=object)
+    words = vocabulary[rng.integers(0, len(vocabulary), size=(count, summary_words + description_words))]
+
+    def sentence(columns):
+        text = pd.Series(columns[:, 0], dtype=object)
+        for i in range(1, columns.shape[1]):
+            text = text + " " + columns[:, i]
+        return text
+
+    summary = sentence(words[:, :summary_words])
+    description = sentence(words[:, summary_words:]) + "."
+
+    def triaged_choice(values):
+        column = np.array(values, dtype=object)[rng.integers(0, len(values), size=count)]
+        column[~triaged] = None
+        return column
+
+    return pd.DataFrame({
+        'ticket_id': [f"TKT-{i:04d}" for i in range(1, count + 1)],
+        'summary': summary.str.capitalize(),
+        'description': description.str.capitalize(),
+        'status': status,
+        'assignee': triaged_choice(assignees),
+        'created_at': "2025-04-16T10:00:00",
+        'category': triaged_choice(categories),
+        'priority': triaged_choice(priorities),
+    })
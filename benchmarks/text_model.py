@@ -0,0 +1,61 @@
+"""
+Training, accuracy and inference throughput of the learned ticket model (automation.model) against the
+keyword rules, on synthetic tickets.
+
+The synthetic history is labelled by the rules themselves, the accuracy is how closely the model learns
+them on held-out closed tickets. Inference runs the category and the priority predictions over every
+ticket, without the prediction cache, for both.
+
+Usage: python -m benchmarks.text_model [tickets] [training tickets]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from automation.batch import _ticket_text, predict_categories, predict_priorities
+from automation.categorizer import category_engine
+from automation.model import TicketModel, accuracy_report, held_out, train
+from automation.prioritizer import priority_engine
+from benchmarks.synthetic import generate_ticket_frame
+
+
+def main(count: int, train_count: int):
+    tickets = generate_ticket_frame(count)
+    triaged = tickets['status'] != 'Open'
+    categories = predict_categories(tickets['summary'][triaged], tickets['description'][triaged])
+    tickets.loc[triaged, 'category'] = categories
+    tickets.loc[triaged, 'priority'] = predict_priorities(tickets['summary'][triaged],
+                                                          tickets['description'][triaged], categories)
+    closed = tickets[tickets['status'] == 'Closed']
+    test = held_out(closed)
+    history = closed[~test].iloc[:train_count]
+
+    start = time.perf_counter()
+    model = train(history)
+    print(f"trained on {len(history)} closed tickets in {time.perf_counter() - start:.1f} s")
+
+    path = os.path.join(tempfile.mkdtemp(), "ticket_model.npz")
+    model.save(path)
+    start = time.perf_counter()
+    loaded = TicketModel.load(path)
+    assert loaded.version == model.version
+    print(f"model {model.version}: {os.path.getsize(path) / 1e6:.1f} MB, loaded in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    print(f"\naccuracy on {test.sum()} held-out closed tickets, against their rule labels")
+    print(accuracy_report(loaded, closed[test]).to_string(index=False))
+
+    text = _ticket_text(tickets['summary'], tickets['description'])
+    print(f"\n{'inference':>10} {'seconds':>8} {'tickets/s':>10}")
+    for name, category, priority in (("rules", category_engine, priority_engine),
+                                     ("model", loaded.category, loaded.priority)):
+        start = time.perf_counter()
+        category.match_series(text)
+        priority.match_series(text)
+        seconds = time.perf_counter() - start
+        print(f"{name:>10} {seconds:>8.2f} {count / seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000, int(sys.argv[2]) if len(sys.argv) > 2 else 200_000)
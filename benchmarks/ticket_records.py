@@ -0,0 +1,86 @@
+"""
+Memory, allocations and time of the per-ticket path with Ticket records against the row dicts it used before.
+
+- convert: pending rows to dicts (DataFrame.loc[idx].to_dict(), one per row) or to records (Ticket.from_frame)
+- retained: memory held by the converted tickets
+- write back: update_ticket with the whole row dict or with the triage fields of the record
+
+Allocations are counted with tracemalloc: blocks still allocated and peak size while converting.
+
+Usage: python -m benchmarks.ticket_records [tickets]
+"""
+import contextlib
+import gc
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_ticket_frame
+from benchmarks.triage_batch import users_file
+from database import JiraMockService, Ticket
+from main import triage_fields
+
+
+def to_dicts(frame):
+    return [frame.loc[idx].to_dict() for idx in frame.index]
+
+
+def measure(convert, frame):
+    """Seconds, retained bytes, retained blocks and peak bytes of converting the frame."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = convert(frame)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    statistics = snapshot.statistics("filename")
+    retained = sum(stat.size for stat in statistics)
+    blocks = sum(stat.count for stat in statistics)
+    del result
+    return seconds, retained, blocks, peak
+
+
+def write_back(jira, tickets, fields) -> float:
+    start = time.perf_counter()
+    for ticket in tickets:
+        jira.update_ticket(ticket['ticket_id'], {field: ticket[field] for field in fields})
+    return time.perf_counter() - start
+
+
+def main(count: int):
+    frame = generate_ticket_frame(count, status_mix={'Open': 1})
+    print(f"{count} pending tickets")
+    print(f"{'path':>8} {'convert s':>10} {'retained MB':>12} {'blocks':>9} {'peak MB':>8} {'B/ticket':>9}")
+    for name, convert in (("dict", to_dicts), ("record", Ticket.from_frame)):
+        seconds, retained, blocks, peak = measure(convert, frame)
+        print(f"{name:>8} {seconds:>10.3f} {retained / 2 ** 20:>12.1f} {blocks:>9} {peak / 2 ** 20:>8.1f} "
+              f"{retained / count:>9.0f}")
+
+    workdir = tempfile.mkdtemp()
+    try:
+        tickets_file = os.path.join(workdir, "tickets.csv")
+        frame.to_csv(tickets_file, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            jira = JiraMockService(tickets_file, users_file, auto_save=False)
+        sample = min(count, 2000)
+        rows = to_dicts(frame.head(sample))
+        records = Ticket.from_frame(frame.head(sample))
+        for ticket in records:
+            ticket.category, ticket.priority, ticket.assignee = "Hardware", "Low", "Alice"
+        full = write_back(jira, rows, list(frame.columns))
+        triage = write_back(jira, records, triage_fields)
+        print(f"write back, per ticket: whole row {full / sample * 1e6:.0f} us, "
+              f"triage fields {triage / sample * 1e6:.0f} us")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,88 @@
+"""
+Checks that the batch triage path gives the same result as the per-ticket path and times both.
+
+Usage: python -m benchmarks.triage_batch [tickets]
+"""
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from automation.categorizer import category_rules
+from automation.prioritizer import priority_rules
+from database import JiraMockService
+from main import TicketWatcher
+
+statuses = ["Open", "Open", "In Progress", "Waiting for User", "Resolved", "Closed"]
+filler = ["user", "reports", "the", "machine", "after", "reboot", "morning", "team", "floor", "ticket"]
+keywords = [word for _, words in category_rules + priority_rules for word in words]
+users_file = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "database", "jira_users.csv"))
+
+
+def generate_tickets(count: int, seed: int = 7) -> pd.DataFrame:
+    rng = random.Random(seed)
+    names = pd.read_csv(users_file)['name'].tolist()
+    rows = []
+    for i in range(count):
+        status = rng.choice(statuses)
+        words = rng.sample(filler, 4) + rng.sample(keywords, rng.randint(0, 2))
+        rng.shuffle(words)
+        # Some pending tickets already carry part of their triage
+        triaged = status != "Open" or rng.random() < 0.2
+        rows.append({
+            'ticket_id': f"TKT-{i + 1:04d}",
+            'summary': " ".join(words[:3]).capitalize(),
+            'description': " ".join(words[3:]).capitalize() + ".",
+            'status': status,
+            'assignee': rng.choice(names) if triaged and rng.random() < 0.8 else None,
+            'created_at': "2025-04-16T10:00:00",
+            'category': rng.choice(category_rules)[0] if triaged and rng.random() < 0.8 else None,
+            'priority': rng.choice(priority_rules)[0] if triaged and rng.random() < 0.8 else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def run(watcher: TicketWatcher, batch_mode: bool) -> float:
+    tickets = watcher.jira.get_all_tickets()
+    users = watcher.jira.get_all_users()
+    pending = tickets[
+        (tickets['status'] == 'Open') &
+        (tickets['category'].isnull() | tickets['priority'].isnull() | tickets['assignee'].isnull())
+    ]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if batch_mode:
+            watcher._triage_batch(pending, tickets, users)
+        else:
+            watcher._triage_per_ticket(pending, tickets, users)
+    return time.perf_counter() - start
+
+
+def main(count: int):
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {}
+        timings = {}
+        for batch_mode in (False, True):
+            tickets_file = os.path.join(workdir, f"tickets_{batch_mode}.csv")
+            generate_tickets(count).to_csv(tickets_file, index=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                jira = JiraMockService(tickets_file, users_file, auto_save=False)
+            watcher = TicketWatcher(jira=jira, batch_mode=batch_mode)
+            timings[batch_mode] = run(watcher, batch_mode)
+            results[batch_mode] = jira.get_all_tickets()
+
+        pd.testing.assert_frame_equal(results[False].fillna("-"), results[True].fillna("-"))
+        print(f"{count} tickets: per-ticket {timings[False]:.3f}s, batch {timings[True]:.3f}s, results identical")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,91 @@
+"""
+Time to assignment per priority while the watcher works through a large import, with and without a cycle budget.
+
+A backlog of untriaged tickets of mixed priorities is loaded, then Critical tickets keep arriving
+while it is triaged. Without a budget each pass triages everything it has queued, so the tickets
+created meanwhile wait for the whole pass. With a budget the queue is served most urgent first in
+bounded batches and every pass picks up the new tickets.
+
+Usage: python -m benchmarks.triage_scheduler [backlog] [cycle budget seconds] [batch size]
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from threading import Event, Thread
+
+import main
+from automation import TriageScheduler
+from benchmarks.synthetic import generate_ticket_frame
+from benchmarks.triage_batch import users_file
+from database import JiraMockService
+from monitoring import Metrics
+
+arrival_interval = 0.05
+# Backlog texts, none of them Critical: Low, Medium and High once categorized
+backlog_texts = ["Print job stuck in the queue", "Printing the report fails", "Keyboard not working",
+                 "Laptop slow since this morning", "Missing email in outlook", "Vpn connection drops"]
+
+
+def run(backlog: int, cycle_budget, batch_size: int) -> tuple:
+    """Returns the seconds to clear the backlog and the latency report of the scheduler."""
+    workdir = tempfile.mkdtemp()
+    try:
+        tickets_file = os.path.join(workdir, "tickets.csv")
+        tickets = generate_ticket_frame(backlog, status_mix={'Open': 1})
+        tickets['summary'] = [backlog_texts[i % len(backlog_texts)] for i in range(backlog)]
+        tickets['description'] = ""
+        tickets.to_csv(tickets_file, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            jira = JiraMockService(tickets_file, users_file, auto_save=False)
+            watcher = main.TicketWatcher(interval=0.05, notification_mail_interval=3600, jira=jira,
+                                         cycle_budget=cycle_budget, batch_size=batch_size)
+        watcher.scheduler = TriageScheduler(metrics=Metrics())
+
+        arriving = Event()
+
+        def feed():
+            while not arriving.wait(arrival_interval):
+                jira.create_ticket({'summary': "Account locked after security alert", 'description': "",
+                                    'assignee': None})
+
+        feeder = Thread(target=feed)
+        main.summary_tickets_email = lambda tickets, assignees=None, **kwargs: None
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            watcher.start()
+            feeder.start()
+            while len(jira.find_tickets_needing_triage()) > 0 or not watcher.scheduler.latency():
+                if not watcher._thread.is_alive():
+                    raise RuntimeError("The watch loop died, see its traceback above")
+                time.sleep(0.05)
+            cleared = time.perf_counter() - start
+            arriving.set()
+            feeder.join()
+            # Let the last arrivals be triaged
+            time.sleep(0.5)
+            watcher.stop()
+        return cleared, watcher.scheduler.latency()
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main_benchmark(backlog: int, cycle_budget: float, batch_size: int):
+    print(f"{backlog} tickets imported, a Critical one every {arrival_interval * 1000:.0f} ms while triaging")
+    print(f"{'mode':>24} {'cleared s':>10} {'priority':>9} {'tickets':>8} {'p50 s':>7} {'p99 s':>7}")
+    for mode, budget, size in (("whole backlog per pass", None, batch_size),
+                               (f"{cycle_budget}s budget, {batch_size}/batch", cycle_budget, batch_size)):
+        cleared, latency = run(backlog, budget, size)
+        for i, (priority, stats) in enumerate(latency.items()):
+            label, seconds = (mode, f"{cleared:.2f}") if i == 0 else ("", "")
+            print(f"{label:>24} {seconds:>10} {priority:>9} {stats['count']:>8} {stats['p50']:>7.2f} "
+                  f"{stats['p99']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000,
+                   float(sys.argv[2]) if len(sys.argv) > 2 else 0.25,
+                   int(sys.argv[3]) if len(sys.argv) > 3 else 1000)
@@ -1,54 +1,378 @@
-import pandas as pd
+import bisect
+import itertools
 import os
+import re
+from typing import Callable
+
+import pandas as pd
+
+from database.StorageEngine import ArchiveFile, max_key_number, storage_engines
+
+# With copy-on-write (always on from pandas 3) a shallow copy is an isolated snapshot
+_lazy_copy = int(pd.__version__.split('.')[0]) >= 3
 
 class EntityService:
     file_path = ''
 
-    def __init__(self, file_path: str, columns: list[str], key: str, prefix: str):
+    def __init__(self, file_path: str, columns: list[str], key: str, prefix: str, storage: str = 'csv',
+                 sequence=None, categorical: list[str] = (), resident=None, chunksize: int = 100_000, indexes=()):
+        """
+        resident, when given, is a function of a DataFrame returning the mask of the records to keep in memory.
+        The other records are paged out to '<file>.archive.csv' while loading and on every save, and are
+        only reachable through iter_rows and export_csv afterwards: get, update and delete see the resident
+        records. The table is then loaded in chunks of chunksize rows where the storage engine allows it.
+
+        indexes are secondary indexes (see TicketIndex) rebuilt on load and kept up to date on every mutation.
+        """
         self.file_path = file_path
         self.key = key if key else 'ID'
         self.prefix = prefix
         self.columns = columns
+        self.storage = storage_engines[storage](self.file_path, self.columns, self.key, categorical)
+        self._changes = []
+        # Change feed: every mutation takes the next number of the (possibly shared) sequence
+        self._sequence = sequence if sequence else itertools.count(1)
+        self.version = 0
+        self._feed_versions = []
+        self._feed_keys = []
+        self._key_versions = {}
+        self._snapshot = None
+        self._snapshot_version = None
+        self.resident = resident
+        self.chunksize = chunksize
+        self.archive = ArchiveFile(f"{os.path.splitext(file_path)[0]}.archive.csv", columns, self.key) \
+            if resident else None
         self._ensure_file_exists()
         self.data = self._load_table()
-        pass
+        self._reindex()
+        self.indexes = list(indexes)
+        for index in self.indexes:
+            index.rebuild(self.data)
+        # Next key number, only ever moves forward so keys are not reused after a delete, even across restarts:
+        # the highest one handed out is saved to '<file>.seq' before the commits that may store it. Tables
+        # without one take a pass over the stored keys (and the archived ones) once, and save it right away.
+        self._next_id_path = f"{os.path.splitext(file_path)[0]}.seq"
+        self._saved_id = self._read_saved_id()
+        if self._saved_id is None:
+            self._saved_id = 0
+            highest = max_key_number(self.data[self.key], self.prefix)
+            if self.archive:
+                highest = max(highest, self.archive.max_key_number(self.prefix))
+            self._next_id = highest + 1
+            self._save_next_id()
+        else:
+            self._next_id = self._saved_id + 1
 
     def _ensure_file_exists(self):
         """Ensure CSV file exists with headers."""
-        if not os.path.exists(self.file_path):
-            pd.DataFrame(columns=self.columns).to_csv(self.file_path, index=False)
+        self.storage.ensure_exists()
 
     def _load_table(self):
-        """Load table from CSV into a DataFrame, ensuring proper handling of empty files."""
-        df = pd.read_csv(self.file_path, delimiter=',')
-        if df.empty:
-            df = pd.DataFrame(columns=self.columns)
-        return df
+        """Load table through the storage engine, ensuring proper handling of empty files."""
+        if not self.resident:
+            return self.storage.load()
+
+        # Only the resident records are kept, the others go to the archive chunk by chunk
+        pending = pd.Series(self.archive.pending_keys(), dtype=object)
+        in_table = set()
+        if not pending.empty:
+            # Left by a crash: the provisional records the table on disk still has are dropped from the archive
+            for chunk in self.storage.iter_load(self.chunksize):
+                in_table.update(pending[pending.isin(chunk[self.key])])
+        self.archive.recover(in_table)
+        parts = []
+        for chunk in self.storage.iter_load(self.chunksize):
+            mask = self.resident(chunk)
+            parts.append(chunk[mask])
+            if not mask.all():
+                self.archive.begin()
+                self.archive.append(chunk[~mask])
+        data = self.storage._typed(pd.concat(parts, ignore_index=True)) if parts else \
+            pd.DataFrame(columns=self.columns, dtype=object)
+
+        if self.archive.is_pending():
+            # The table on disk no longer holds the paged out records
+            self.storage.rewrite(data)
+            self.archive.settle()
+        return data
 
     def save_changes(self):
-        """Save the current state of DataFrames back to CSV files."""
-        self.data.to_csv(self.file_path, index=False)
+        """Commit the changes made since the last save through the storage engine."""
+        self.commit(*self.take_changes())
+
+    def commit(self, table: Callable[[], pd.DataFrame], changes: list):
+        """Commit the changes and the table function as returned by take_changes."""
+        self._save_next_id()
+        self.storage.commit(table, changes)
+        if self.archive:
+            self.archive.settle()
+
+    def has_changes(self) -> bool:
+        """Whether changes were made since the last save."""
+        return bool(self._changes)
+
+    def take_changes(self):
+        """
+        Detach the changes made since the last save, together with the function taking a snapshot of the
+        table, which the storage engine calls only when it writes the whole table. Records no longer resident
+        are moved to the archive first.
+        """
+        self.page_out()
+        changes, self._changes = self._changes, []
+        return self.snapshot, changes
+
+    def page_out(self) -> int:
+        """Append the records the resident filter rejects to the archive and drop them. Returns how many."""
+        if not self.resident or self.data.empty:
+            return 0
+        mask = self.resident(self.data)
+        if mask.all():
+            return 0
+        paged = self.data[~mask]
+        # Provisional until the table without them is committed
+        self.archive.begin()
+        self.archive.append(paged)
+        self.data = self.data[mask]
+        self._reindex()
+        for index in self.indexes:
+            index.remove(paged[self.key])
+        for row_id in paged[self.key]:
+            self._record({'op': 'archive', 'key': row_id})
+        return len(paged)
+
+    def iter_rows(self, filter=None, chunksize: int = 10_000):
+        """
+        Every record, resident ones first and then the archived ones, as DataFrame chunks of at most
+        chunksize rows. filter is a function of a chunk returning the mask of the records to yield.
+
+        The resident records and the extent of the archive are fixed when this is called, records
+        paged out afterwards are not listed twice.
+        """
+        return self._iter_rows(self.snapshot(), self.archive.size() if self.archive else 0, filter, chunksize)
+
+    def _iter_rows(self, data: pd.DataFrame, archive_size: int, filter, chunksize: int):
+        chunks = (data.iloc[start:start + chunksize] for start in range(0, len(data), chunksize))
+        if archive_size:
+            chunks = itertools.chain(chunks, self.archive.iter_chunks(chunksize, archive_size))
+        for chunk in chunks:
+            if filter is not None:
+                chunk = chunk[filter(chunk)]
+            if not chunk.empty:
+                yield chunk
+
+    def export_csv(self, path: str, filter=None, chunksize: int = 10_000) -> int:
+        """Stream the records matching filter (every record by default) to a CSV file. Returns the row count."""
+        return write_csv_chunks(self.iter_rows(filter, chunksize), path, self.columns)
+
+    def snapshot(self) -> pd.DataFrame:
+        """Point-in-time view of the table that later writes do not affect, cached per version."""
+        if self._snapshot is None or self._snapshot_version != self.version:
+            self._snapshot = self.data.copy(deep=not _lazy_copy)
+            self._snapshot_version = self.version
+        return self._snapshot
+
+    def changed_after(self, row_id, version: int) -> bool:
+        """Whether the record was inserted, updated or deleted after the given version."""
+        return self._key_versions.get(row_id, 0) > version
+
+    def _reindex(self):
+        """Rebuild the key -> row position index used for point reads and writes."""
+        self.data = self.data.reset_index(drop=True)
+        self._index = {row_id: pos for pos, row_id in enumerate(self.data[self.key])}
+
+    def _record(self, change: dict):
+        """Queue a change for the storage engine and publish it on the change feed."""
+        self._changes.append(change)
+        self.version = next(self._sequence)
+        self._feed_versions.append(self.version)
+        self._feed_keys.append(change['key'])
+        self._key_versions[change['key']] = self.version
+
+        # Keep only the latest entry per key once the feed is mostly superseded entries
+        if len(self._feed_keys) > 2 * len(self._key_versions) + 1024:
+            latest = sorted((version, row_id) for row_id, version in self._key_versions.items())
+            self._feed_versions = [version for version, _ in latest]
+            self._feed_keys = [row_id for _, row_id in latest]
+
+    def changes_since(self, version: int) -> list:
+        """Keys inserted, updated or deleted after the given version, each listed once."""
+        if version >= self.version:
+            return []
+        start = bisect.bisect_right(self._feed_versions, version)
+        return list(dict.fromkeys(self._feed_keys[start:]))
+
+    def get(self, row_id) -> dict:
+        """Return a record by key, or an empty dict when it does not exist."""
+        pos = self._index.get(row_id)
+        if pos is None:
+            return {}
+        return self.data.iloc[pos].to_dict()
+
+    def get_many(self, row_ids, in_table_order: bool = False) -> pd.DataFrame:
+        """Return the existing records among the given keys, in the order given or in table order."""
+        positions = [self._index[row_id] for row_id in row_ids if row_id in self._index]
+        if in_table_order:
+            positions.sort()
+        return self.data.iloc[positions]
+
+    def _update_indexes(self, changes: dict):
+        """Re-index the records after they were inserted or updated, changes maps their keys to the values written."""
+        for index in self.indexes:
+            index.update(self._current_values(changes, index.columns))
+
+    def _current_values(self, changes: dict, columns: list) -> list:
+        """
+        The given columns of the changed records, as dicts. Only the columns that were not written are read
+        from the table: one by one for a few records, scalar reads being cheaper than slicing the frame.
+        """
+        if len(changes) > 100:
+            rows = self.get_many(changes)
+            return [dict(zip(columns, values)) for values in zip(*(rows[col] for col in columns))]
+        locations = {col: self.data.columns.get_loc(col) for col in columns}
+        return [{col: data[col] if col in data else
+                 row_id if col == self.key else
+                 self.data.iat[self._index[row_id], locations[col]]
+                 for col in columns}
+                for row_id, data in changes.items()]
+
+    def _read_saved_id(self):
+        """Highest key number saved to the sequence file, None without one."""
+        if not os.path.exists(self._next_id_path):
+            return None
+        with open(self._next_id_path, encoding="utf-8") as f:
+            return int(f.read())
+
+    def _save_next_id(self):
+        """Save the highest key number handed out, when it moved since the last save."""
+        highest = self._next_id - 1
+        if highest <= self._saved_id:
+            return
+        tmp_path = f"{self._next_id_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(highest))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._next_id_path)
+        self._saved_id = highest
 
     def _generate_ticket_id(self) -> str:
-        if self.data.empty:
-            return f"{self.prefix}-0001"
-        last_num = self.data.shape[0] + 1
-        return f"{self.prefix}-{last_num:04d}"
+        key = f"{self.prefix}-{self._next_id:04d}"
+        self._next_id += 1
+        return key
 
     def insert(self, data):
         """Insert a new record into the table."""
-        if self.key not in data:
-            data[self.key] = self._generate_ticket_id()
-        self.data = pd.concat([self.data, pd.DataFrame([data], columns=self.columns)], ignore_index=True)
-        return data
+        return self.insert_many([data])[0]
+
+    def insert_many(self, records) -> list:
+        """
+        Insert several records with a single concat, keys are generated for the records without one.
+        Returns the inserted records.
+        """
+        records = list(records)
+        if not records:
+            return records
+        for data in records:
+            if self.key not in data:
+                data[self.key] = self._generate_ticket_id()
+            else:
+                # Given keys of the generated form move the sequence past them
+                number = re.fullmatch(rf"{re.escape(self.prefix)}-(\d+)", str(data[self.key]))
+                if number:
+                    self._next_id = max(self._next_id, int(number.group(1)) + 1)
+        rows = pd.DataFrame.from_records(records, columns=self.columns)
+        self._prepare_write(self.columns, [[data.get(col) for col in self.columns] for data in records])
+        for col in self.columns:
+            # Matching categoricals stay categorical through concat
+            if isinstance(self.data[col].dtype, pd.CategoricalDtype):
+                rows[col] = rows[col].astype(self.data[col].dtype)
+        start = len(self.data)
+        self.data = pd.concat([self.data, rows], ignore_index=True)
+        for pos, data in enumerate(records, start):
+            self._index[data[self.key]] = pos
+            self._record({'op': 'insert', 'key': data[self.key], 'data': dict(data)})
+        if self.indexes:
+            self._update_indexes({data[self.key]: {col: data.get(col) for col in self.columns} for data in records})
+        return records
 
     def update(self, row_id, data):
         """Update a record in the table."""
-        for col, val in data.items():
-            self.data.loc[self.data[self.key] == row_id, col] = val
+        pos = self._index.get(row_id)
+        if pos is None:
+            return data
+
+        self._prepare_write(list(data), [list(data.values())])
+        # Single positional write of every column instead of one key scan per column
+        self.data.iloc[pos, self.data.columns.get_indexer(list(data))] = list(data.values())
 
+        self._record({'op': 'update', 'key': row_id, 'data': dict(data)})
+        self._update_indexes({row_id: data})
         return data
 
+    def update_many(self, updates: dict, unchanged_since: int = None) -> dict:
+        """
+        Update several records at once.
+
+        updates maps each key to the columns to write. Records sharing the same set of
+        columns are written with a single positional assignment. With unchanged_since,
+        records changed after that version are left alone (optimistic concurrency).
+
+        Returns the updates that were applied.
+        """
+        groups = {}
+        applied = {}
+        for row_id, data in updates.items():
+            pos = self._index.get(row_id)
+            if pos is None:
+                continue
+            if unchanged_since is not None and self.changed_after(row_id, unchanged_since):
+                continue
+            applied[row_id] = data
+            positions, values = groups.setdefault(tuple(data), ([], []))
+            positions.append(pos)
+            values.append(list(data.values()))
+            self._record({'op': 'update', 'key': row_id, 'data': dict(data)})
+
+        for cols, (positions, values) in groups.items():
+            self._prepare_write(list(cols), values)
+            self.data.iloc[positions, self.data.columns.get_indexer(list(cols))] = values
+
+        self._update_indexes(applied)
+        return applied
+
+    def _prepare_write(self, columns: list, rows: list):
+        """Create missing columns and add the values about to be written to the categories of categorical columns."""
+        for i, col in enumerate(columns):
+            if col not in self.data.columns:
+                self.data[col] = None
+            elif isinstance(self.data[col].dtype, pd.CategoricalDtype):
+                new = {row[i] for row in rows if not pd.isnull(row[i])} - set(self.data[col].cat.categories)
+                if new:
+                    self.data[col] = self.data[col].cat.add_categories(sorted(new))
+
     def delete(self, row_id):
         """Delete a record from the table."""
-        self.data = self.data[self.data[self.key] != row_id]
\ No newline at end of file
+        if row_id not in self._index:
+            return
+        self.data = self.data.drop(index=self._index[row_id])
+        # Positions after the deleted row shift down by one
+        self._reindex()
+        for index in self.indexes:
+            index.remove([row_id])
+        self._record({'op': 'delete', 'key': row_id})
+
+
+def write_csv_chunks(chunks, path: str, columns: list[str]) -> int:
+    """
+    Write DataFrame chunks to a CSV file as they come, through a temporary file and a rename.
+    Returns the row count.
+    """
+    tmp_path = f"{path}.tmp"
+    rows = 0
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        pd.DataFrame(columns=columns).to_csv(f, index=False)
+        for chunk in chunks:
+            chunk[columns].to_csv(f, index=False, header=False)
+            rows += len(chunk)
+    os.replace(tmp_path, path)
+    return rows
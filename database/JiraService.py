@@ -1,79 +1,241 @@
-from typing import Dict, List
+from typing import Dict, Iterable, List, Tuple
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from threading import Lock, RLock, local
+import itertools
 import random
 
 import pandas as pd
 
-from database.EntityService import EntityService
+from database.EntityService import EntityService, write_csv_chunks
+from database.TicketIndex import TicketIndex
+from monitoring import TimedLock, registry
 
 class JiraMockService:
 
-    def __init__(self, tickets_file: str = "database/jira_tickets.csv", users_file='database/jira_users.csv', auto_save=True):
-        """Initialize the JIRA service."""
+    def __init__(self, tickets_file: str = "database/jira_tickets.csv", users_file='database/jira_users.csv', auto_save=True,
+                 storage: str = 'csv', archive_closed: bool = False):
+        """
+        Initialize the JIRA service.
+
+        storage selects the on-disk engine: 'csv' rewrites the files on every save,
+        'log' appends changes to a write-ahead log that is periodically compacted,
+        'feather' and 'feather-log' do the same with columnar Feather files (needs pyarrow)
+        where status, category, priority and assignee are stored as categories.
+
+        archive_closed keeps only the tickets that are not Closed in memory. Closed tickets are paged
+        out to '<tickets file>.archive.csv' on load and on every save, and are then only listed by
+        iter_tickets and export_tickets.
+        """
         print('Initializing Jira Service', [tickets_file, users_file])
         self.tickets_file = tickets_file
         self.users_file = users_file
+        # Both tables draw their change versions from one sequence
+        sequence = itertools.count(1)
+        # status -> tickets, tickets needing triage and assignee -> active tickets, updated on every mutation
+        self.ticket_index = TicketIndex()
         self.tickets_service = EntityService(self.tickets_file,
                                       ['ticket_id', 'summary', 'description', 'status', 'assignee', 'created_at', 'category', 'priority'],
                                              'ticket_id',
-                                             'TKT')
+                                             'TKT',
+                                             storage,
+                                             sequence,
+                                             ['status', 'category', 'priority', 'assignee'],
+                                             _not_closed if archive_closed else None,
+                                             indexes=[self.ticket_index])
         self.users_service = EntityService(self.users_file,
                                         ['user_id', 'name', 'email', 'role', 'phone'],
                                            'user_id',
-                                           'USER')
+                                           'USER',
+                                           storage,
+                                           sequence)
         self.auto_save = auto_save
+        # Writers hold _lock only while changing the tables, readers only while taking a snapshot.
+        # Saves are serialized separately so the disk write happens outside of _lock.
+        # Time spent waiting for either lock is recorded in ticket_watcher_lock_wait_seconds
+        self._lock = TimedLock(RLock(), registry.histogram('ticket_watcher_lock_wait_seconds', lock='tables'))
+        self._save_lock = TimedLock(Lock(), registry.histogram('ticket_watcher_lock_wait_seconds', lock='save'))
+        # Depth of the batch blocks open on each thread
+        self._deferred = local()
 
     def create_ticket(self, ticket: Dict) -> Dict:
-        ticket = {
+        return self.create_tickets([ticket])[0]
+
+    def create_tickets(self, tickets: Iterable[Dict]) -> List[Dict]:
+        """
+        Create several tickets with a single insert and a single save. Returns the created tickets.
+        """
+        created_at = datetime.now().isoformat()
+        tickets = [{
             'summary': ticket['summary'],
             'description': ticket['description'],
             'status': ticket['status'] if 'status' in ticket else 'Open',
             'assignee': ticket['assignee'],
-            'created_at': datetime.now().isoformat(),
+            'created_at': created_at,
             'category': ticket['category'] if 'category' in ticket else None,
             'priority': ticket['priority'] if 'priority' in ticket else None,
-        }
-        ticket = self.tickets_service.insert(ticket)
-        if self.auto_save:
+        } for ticket in tickets]
+        with self._lock:
+            tickets = self.tickets_service.insert_many(tickets)
+        if self._auto_saving():
             self.save()
-        return ticket
+        return tickets
 
     def create_user(self, user: Dict) -> Dict:
-        user = {
+        return self.create_users([user])[0]
+
+    def create_users(self, users: Iterable[Dict]) -> List[Dict]:
+        """
+        Create several users with a single insert and a single save. Returns the created users.
+        """
+        users = [{
             "name": user['name'],
             "email": user['email'],
             "role": user['role'],
             "phone": user['phone']
-        }
-        user = self.users_service.insert(user)
-        if self.auto_save:
+        } for user in users]
+        with self._lock:
+            users = self.users_service.insert_many(users)
+        if self._auto_saving():
             self.save()
-        return user
+        return users
 
     def update_ticket(self, ticket_id: str, data: Dict) -> Dict:
-        ticket = self.tickets_service.update(ticket_id, data)
-        if self.auto_save:
+        with self._lock:
+            ticket = self.tickets_service.update(ticket_id, data)
+        if self._auto_saving():
             self.save()
         return ticket
 
+    def update_tickets(self, updates: Dict[str, Dict], unchanged_since: int = None) -> Dict[str, Dict]:
+        """
+        Update several tickets, given as ticket_id -> data, with a single save.
+
+        With unchanged_since, tickets changed after that version are skipped so decisions taken on an
+        older snapshot never overwrite newer data. Returns the updates that were applied.
+        """
+        with self._lock:
+            updates = self.tickets_service.update_many(updates, unchanged_since)
+        if self._auto_saving():
+            self.save()
+        return updates
+
     def get_all_tickets(self) -> pd.DataFrame:
-        return self.tickets_service.data
+        """Read-only point-in-time view of the tickets."""
+        with self._lock:
+            return self.tickets_service.snapshot()
 
     def get_all_users(self) -> pd.DataFrame:
-        return self.users_service.data
+        """Read-only point-in-time view of the users."""
+        with self._lock:
+            return self.users_service.snapshot()
+
+    def snapshot(self) -> Tuple[int, pd.DataFrame, pd.DataFrame]:
+        """Consistent read-only view of both tables, with the version it reflects."""
+        with self._lock:
+            return self.version, self.tickets_service.snapshot(), self.users_service.snapshot()
+
+    @property
+    def version(self) -> int:
+        """Monotonically increasing number of the latest ticket or user mutation, 0 before any."""
+        return max(self.tickets_service.version, self.users_service.version)
+
+    def ticket_changes_since(self, version: int) -> List[str]:
+        """IDs of the tickets created, updated or deleted after the given version."""
+        with self._lock:
+            return self.tickets_service.changes_since(version)
+
+    def user_changes_since(self, version: int) -> List[str]:
+        """IDs of the users created, updated or deleted after the given version."""
+        with self._lock:
+            return self.users_service.changes_since(version)
+
+    def iter_tickets(self, filter=None, chunksize: int = 10_000):
+        """
+        Every ticket, archived ones included, as DataFrame chunks of at most chunksize rows.
+        filter is a function of a chunk returning the mask of the tickets to yield.
+        """
+        with self._lock:
+            return self.tickets_service.iter_rows(filter, chunksize)
+
+    def export_tickets(self, path: str, filter=None, chunksize: int = 10_000) -> int:
+        """Stream the tickets matching filter, archived ones included, to a CSV file. Returns the row count."""
+        return write_csv_chunks(self.iter_tickets(filter, chunksize), path, self.tickets_service.columns)
+
+    def ticket_ids_by_status(self, status: str) -> List[str]:
+        """IDs of the (resident) tickets in the given status."""
+        with self._lock:
+            return list(self.ticket_index.by_status.get(status, ()))
+
+    def find_tickets_needing_triage(self) -> pd.DataFrame:
+        """Open tickets missing a category, priority or assignee, in table order."""
+        with self._lock:
+            return self.tickets_service.get_many(self.ticket_index.needs_triage, in_table_order=True)
+
+    def find_active_tickets(self, assignees: Iterable[str] = None) -> pd.DataFrame:
+        """
+        Assigned tickets in an active status (Open, In Progress, Waiting for User), of the given assignees
+        or of everybody, in table order.
+        """
+        with self._lock:
+            return self.tickets_service.get_many(self.ticket_index.active_ids(assignees), in_table_order=True)
+
+    def find_tickets_by_ids(self, ticket_ids: List[str]) -> pd.DataFrame:
+        with self._lock:
+            return self.tickets_service.get_many(ticket_ids)
 
     def find_ticket_by_id(self, ticket_id: str) -> Dict:
-        match = self.tickets_service.data[self.tickets_service.data['ticket_id'] == ticket_id]
-        return match.to_dict(orient='records')[0] if not match.empty else {}
+        with self._lock:
+            return self.tickets_service.get(ticket_id)
 
-    def find_user_by_id(self, ticket_id: str) -> Dict:
-        match = self.tickets_service.data[self.tickets_service.data['user_id'] == ticket_id]
-        return match.to_dict(orient='records')[0] if not match.empty else {}
+    def find_user_by_id(self, user_id: str) -> Dict:
+        with self._lock:
+            return self.users_service.get(user_id)
+
+    def has_unsaved_changes(self) -> bool:
+        """Whether any table changed since the last save."""
+        with self._lock:
+            return self.tickets_service.has_changes() or self.users_service.has_changes()
 
     def save(self):
         """Save all tables."""
-        self.tickets_service.save_changes()
-        self.users_service.save_changes()
+        with self._save_lock:
+            with self._lock:
+                pending = [(service, service.take_changes()) for service in (self.tickets_service, self.users_service)]
+            with registry.timer('ticket_watcher_stage_seconds', stage='save'):
+                for service, (table, changes) in pending:
+                    service.commit(self._locked(table), changes)
+
+    def _locked(self, read):
+        """
+        read taking the lock, for the engines reading the table after it is released. The table may then hold
+        changes made since, they are committed again with the next save and replaying them is idempotent.
+        """
+        def locked():
+            with self._lock:
+                return read()
+        return locked
+
+    @contextmanager
+    def batch(self):
+        """
+        Defer auto-save until the block exits, so every change made inside it is
+        committed with a single save (one fsync with the 'log' storage engine).
+        """
+        # Deferred per thread and nested blocks counted, auto_save itself is left alone so blocks
+        # overlapping on other threads cannot leave it turned off
+        depth = getattr(self._deferred, 'depth', 0)
+        self._deferred.depth = depth + 1
+        try:
+            yield self
+        finally:
+            self._deferred.depth = depth
+            if not depth and self.auto_save:
+                self.save()
+
+    def _auto_saving(self) -> bool:
+        """Whether a change should be saved right away, auto_save outside of a batch block of this thread."""
+        return self.auto_save and not getattr(self._deferred, 'depth', 0)
 
     def initializeData(self):
         # Sample data for mock ticket generation
@@ -133,17 +295,13 @@ class JiraMockService:
         priorities = ["Low", "Medium", "High", "Critical", None]
 
 
-        if len(jira.get_all_users()) == 0:
-            for name in assignees:
-                email = f"{name.lower()}@email.ie"
-                role = random.choice(roles)
-                phone = f"+1-202-{random.randint(100, 999)}-{random.randint(1000, 9999)}"
-                self.create_user({
-                    "name": name,
-                    "email": email,
-                    "role": role,
-                    "phone": phone
-                })
+        if len(self.get_all_users()) == 0:
+            self.create_users({
+                "name": name,
+                "email": f"{name.lower()}@email.ie",
+                "role": random.choice(roles),
+                "phone": f"+1-202-{random.randint(100, 999)}-{random.randint(1000, 9999)}"
+            } for name in assignees)
 
         statuses_distribution = {
             "Open": 30,
@@ -153,22 +311,25 @@ class JiraMockService:
             "Closed": 430  # Total should be 500
         }
 
-        if len(jira.get_all_tickets()) == 0:
-            # Generate 500+ mock tickets
-            ticket_id = 1
+        if len(self.get_all_tickets()) == 0:
+            # Generate 500+ mock tickets, inserted and saved at once
+            tickets = []
             for status, count in statuses_distribution.items():
                 for _ in range(count):
                     idx = random.randint(0, len(summaries) - 1)
-                    ticket = {
+                    tickets.append({
                         'summary': summaries[idx],
                         'description': descriptions[idx],
                         'status': status,
                         'assignee': None if status == 'Open' else random.choice(assignees),
                         'category': None if status == 'Open' else random.choice(categories),
                         'priority': None if status == 'Open' else random.choice(priorities),
-                    }
-                    self.create_ticket(ticket)
-                    ticket_id += 1
+                    })
+            self.create_tickets(tickets)
+
+
+def _not_closed(tickets: pd.DataFrame) -> pd.Series:
+    return tickets['status'] != 'Closed'
 
 
 # --- Example usage ---
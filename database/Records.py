@@ -0,0 +1,94 @@
+import sys
+
+import pandas as pd
+
+
+def _intern(value):
+    """Interned string for the enum-like fields, None for missing values."""
+    if value is None or value != value:
+        return None
+    return sys.intern(str(value))
+
+
+class Record:
+    """
+    Base of the typed records, one slot per column of the table.
+
+    Records are built from a whole frame at once (from_frame converts column by column, not row by row)
+    and turned back into the dicts EntityService writes with to_dict. Missing values are None, never NaN.
+    Fields listed in interned hold interned strings, so equal values share one object.
+    """
+
+    __slots__ = ()
+    fields = ()
+    interned = ()
+
+    def __init__(self, *values, **named):
+        for field, value in zip(self.fields, values):
+            setattr(self, field, value)
+        for field in self.fields[len(values):]:
+            setattr(self, field, named.get(field))
+        for field in self.interned:
+            setattr(self, field, _intern(getattr(self, field)))
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Record from a dict such as the ones returned by find_ticket_by_id, {} gives None."""
+        if not data:
+            return None
+        return cls(*(None if pd.isnull(data.get(field)) else data.get(field) for field in cls.fields))
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> list:
+        """Records of every row of the frame, in order."""
+        columns = []
+        for field in cls.fields:
+            column = frame[field]
+            values = column.astype(object).where(column.notna(), None).tolist()
+            if field in cls.interned:
+                # One intern per distinct value instead of one per row
+                table = {value: _intern(value) for value in set(values)}
+                values = [table[value] for value in values]
+            columns.append(values)
+        record = object.__new__
+        records = []
+        for values in zip(*columns):
+            item = record(cls)
+            for field, value in zip(cls.fields, values):
+                setattr(item, field, value)
+            records.append(item)
+        return records
+
+    def to_dict(self, fields=None) -> dict:
+        """The record, or only the given fields, as a dict of column -> value."""
+        return {field: getattr(self, field) for field in (fields if fields is not None else self.fields)}
+
+    def __getitem__(self, field):
+        # Lets records stand in for the row dicts, ticket['summary'] as well as ticket.summary
+        return getattr(self, field)
+
+    def __contains__(self, field):
+        # Like a row dict that leaves out the missing values, so 'status' in ticket defaults an unset status
+        return getattr(self, field, None) is not None
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(getattr(self, f) == getattr(other, f) for f in self.fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{f}={getattr(self, f)!r}' for f in self.fields)})"
+
+
+class Ticket(Record):
+    """A row of the tickets table."""
+
+    __slots__ = ('ticket_id', 'summary', 'description', 'status', 'assignee', 'created_at', 'category', 'priority')
+    fields = __slots__
+    interned = ('status', 'assignee', 'category', 'priority')
+
+
+class User(Record):
+    """A row of the users table."""
+
+    __slots__ = ('user_id', 'name', 'email', 'role', 'phone')
+    fields = __slots__
+    interned = ('role',)
@@ -0,0 +1,453 @@
+import io
+import json
+import os
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+
+def max_key_number(keys: pd.Series, prefix: str) -> int:
+    """Highest number among the keys of the form <prefix>-<number>, 0 when there is none."""
+    keys = keys.dropna().astype(str)
+    digits = keys[keys.str.startswith(f"{prefix}-")].str.slice(len(prefix) + 1)
+    # Compared as strings, the longest without leading zeros is the highest: to_numeric is much slower
+    digits = digits[digits.str.isdigit()].str.lstrip("0")
+    if digits.empty:
+        return 0
+    lengths = digits.str.len()
+    return int(digits[lengths == lengths.max()].max() or 0)
+
+
+class StorageEngine:
+    """
+    Base class for the on-disk format behind an EntityService table.
+
+    An engine loads the whole table once at startup and is then handed the list of changes
+    made since the last commit, plus a function returning the current DataFrame for the
+    engines that write the whole table. Snapshots are CSV
+    files unless a format mixin such as FeatherFormat overrides _read_snapshot and
+    _write_snapshot.
+    """
+
+    def __init__(self, file_path: str, columns: list[str], key: str, categorical: list[str] = ()):
+        self.file_path = file_path
+        self.columns = columns
+        self.key = key
+        # Low-cardinality columns that formats with typed columns store as categories
+        self.categorical = list(categorical)
+
+    def ensure_exists(self):
+        """Ensure the backing file exists with headers."""
+        if not os.path.exists(self.file_path):
+            self._write_snapshot(pd.DataFrame(columns=self.columns), self.file_path)
+
+    def load(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def commit(self, table: Callable[[], pd.DataFrame], changes: list[dict]):
+        raise NotImplementedError
+
+    def rewrite(self, data: pd.DataFrame):
+        """Replace everything on disk with the given table."""
+        raise NotImplementedError
+
+    def iter_load(self, chunksize: int):
+        """Load the table in chunks of about chunksize rows, engines that cannot stream yield it whole."""
+        yield self.load()
+
+    def _read_snapshot(self) -> pd.DataFrame:
+        # Object columns so a text value can be written into a column loaded as all-NaN
+        df = pd.read_csv(self.file_path, delimiter=',', dtype=object)
+        if df.empty:
+            df = pd.DataFrame(columns=self.columns, dtype=object)
+        return df
+
+    def _iter_snapshot(self, chunksize: int):
+        with pd.read_csv(self.file_path, delimiter=',', dtype=object, chunksize=chunksize) as chunks:
+            yield from chunks
+
+    def _write_snapshot(self, data: pd.DataFrame, path: str):
+        data.to_csv(path, index=False)
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Apply the column types of the snapshot format, CSV keeps everything as object."""
+        return df
+
+
+class CsvStorageEngine(StorageEngine):
+    """Rewrites the full CSV file on every commit."""
+
+    def load(self) -> pd.DataFrame:
+        return self._read_snapshot()
+
+    def iter_load(self, chunksize: int):
+        yield from self._iter_snapshot(chunksize)
+
+    def commit(self, table: Callable[[], pd.DataFrame], changes: list[dict]):
+        self.rewrite(table())
+
+    def rewrite(self, data: pd.DataFrame):
+        # Replace rather than overwrite, a memory-mapped snapshot may still be in use
+        tmp_path = f"{self.file_path}.tmp"
+        self._write_snapshot(data, tmp_path)
+        os.replace(tmp_path, self.file_path)
+
+
+class LogStorageEngine(StorageEngine):
+    """
+    Append-only change log on top of a CSV snapshot.
+
+    Each commit appends the pending changes as a single JSON line to '<file>.wal' and
+    fsyncs once (group commit). Once the log holds 'compact_every' changes it is folded
+    into a fresh snapshot. On startup the snapshot is loaded and the log replayed; a torn
+    trailing line left by a crash mid-write is discarded.
+    """
+
+    def __init__(self, file_path: str, columns: list[str], key: str, categorical: list[str] = (),
+                 compact_every: int = 10000):
+        super().__init__(file_path, columns, key, categorical)
+        self.log_path = f"{file_path}.wal"
+        self.compact_every = compact_every
+        self._log_changes = 0
+
+    def load(self) -> pd.DataFrame:
+        df = self._read_snapshot()
+        batches = self._read_log()
+        if not batches:
+            return df
+
+        # Replay is idempotent (insert is an upsert, update/delete of a missing key is a no-op),
+        # so a crash between writing the snapshot and truncating the log is harmless.
+        # A record moved to the archive file leaves the table like a deleted one.
+        # The log is first folded into the last state of every key it touches, in order, then
+        # applied to the snapshot with a few vectorized writes: the cost follows the log, not the table.
+        inserted, updated, dropped = {}, {}, set()
+        for changes in batches:
+            for change in changes:
+                row_id = change['key']
+                if change['op'] == 'insert':
+                    # Keeps its place when inserted again, goes last when it was deleted in between
+                    updated.pop(row_id, None)
+                    inserted[row_id] = {col: change['data'].get(col) for col in self.columns}
+                elif change['op'] == 'update':
+                    if row_id in inserted:
+                        inserted[row_id].update(change['data'])
+                    elif row_id not in dropped:
+                        updated.setdefault(row_id, {}).update(change['data'])
+                elif change['op'] in ('delete', 'archive'):
+                    inserted.pop(row_id, None)
+                    updated.pop(row_id, None)
+                    dropped.add(row_id)
+            self._log_changes += len(changes)
+        return self._typed(self._apply(df, inserted, updated, dropped))
+
+    def _apply(self, df: pd.DataFrame, inserted: dict, updated: dict, dropped: set) -> pd.DataFrame:
+        """Apply the folded log to the snapshot: drop the removed keys, write the others in place or append them."""
+        if dropped:
+            df = df[~df[self.key].isin(dropped)].reset_index(drop=True)
+        # Positions of the logged keys still in the table, one isin instead of indexing every key
+        hits = np.flatnonzero(df[self.key].isin(list(updated) + list(inserted)))
+        positions = dict(zip(df[self.key].iloc[hits].tolist(), hits.tolist()))
+        # Columns written together are written with one positional assignment
+        groups = {}
+        for changes in (updated, inserted):
+            for row_id, data in changes.items():
+                if row_id in positions:
+                    group = groups.setdefault(tuple(data), ([], []))
+                    group[0].append(positions[row_id])
+                    group[1].append(list(data.values()))
+        appended = [row for row_id, row in inserted.items() if row_id not in positions]
+
+        for cols, (rows, values) in groups.items():
+            df = self._prepare_columns(df, cols, values)
+            df.iloc[rows, df.columns.get_indexer(list(cols))] = values
+        if appended:
+            df = self._prepare_columns(df, self.columns, [list(row.values()) for row in appended])
+            new = pd.DataFrame.from_records(appended, columns=self.columns)
+            for col in self.columns:
+                if isinstance(df[col].dtype, pd.CategoricalDtype):
+                    new[col] = new[col].astype(df[col].dtype)
+            df = pd.concat([df, new], ignore_index=True)
+        return df
+
+    @staticmethod
+    def _prepare_columns(df: pd.DataFrame, columns, rows: list) -> pd.DataFrame:
+        """Add the missing columns, and the values about to be written to the categories of categorical columns."""
+        for i, col in enumerate(columns):
+            if col not in df.columns:
+                df[col] = None
+            elif isinstance(df[col].dtype, pd.CategoricalDtype):
+                new = {row[i] for row in rows if not pd.isnull(row[i])} - set(df[col].cat.categories)
+                if new:
+                    df[col] = df[col].cat.add_categories(sorted(new))
+        return df
+
+    def commit(self, table: Callable[[], pd.DataFrame], changes: list[dict]):
+        if not changes:
+            return
+
+        line = json.dumps(changes, default=_json_default) + "\n"
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_changes += len(changes)
+
+        # The table is only read when compacting, a snapshot per commit would make the next writes copy it
+        if self._log_changes >= self.compact_every:
+            self.compact(table())
+
+    def rewrite(self, data: pd.DataFrame):
+        self.compact(data)
+
+    def compact(self, data: pd.DataFrame):
+        """Write the current table as the new snapshot and truncate the log."""
+        tmp_path = f"{self.file_path}.tmp"
+        self._write_snapshot(data, tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+
+        with open(self.log_path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_changes = 0
+
+    def _read_log(self) -> list[list[dict]]:
+        if not os.path.exists(self.log_path):
+            return []
+
+        batches = []
+        valid_bytes = 0
+        with open(self.log_path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    batches.append(json.loads(raw))
+                except ValueError:
+                    break
+                valid_bytes += len(raw)
+
+        # Drop whatever follows the last complete batch so later appends stay parseable
+        if valid_bytes < os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return batches
+
+
+class FeatherFormat:
+    """
+    Snapshot format mixin: uncompressed Arrow IPC (Feather v2) files next to the CSV path,
+    read through a memory map. The categorical columns are stored dictionary encoded and
+    come back as pandas categoricals. With pandas 3 the text columns come back as
+    Arrow-backed strings straight from the map, cheap to load and to keep resident but
+    slower to write to than object columns, which suits the read-mostly text fields.
+
+    Needs the optional pyarrow package.
+    """
+
+    def __init__(self, file_path: str, *args, **kwargs):
+        super().__init__(f"{os.path.splitext(file_path)[0]}.feather", *args, **kwargs)
+
+    def _read_snapshot(self) -> pd.DataFrame:
+        feather = _import_feather()
+        df = feather.read_table(self.file_path, memory_map=True).to_pandas()
+        if df.empty:
+            df = pd.DataFrame(columns=self.columns, dtype=object)
+        return self._typed(df)
+
+    def _iter_snapshot(self, chunksize: int):
+        # Record batches as written, write_feather cuts them at 64k rows
+        feather = _import_feather()
+        table = feather.read_table(self.file_path, memory_map=True)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield self._typed(batch.to_pandas())
+
+    def _write_snapshot(self, data: pd.DataFrame, path: str):
+        feather = _import_feather()
+        feather.write_feather(self._typed(data), path, compression="uncompressed")
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy(deep=False)
+        for col in self.categorical:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        return df
+
+
+class FeatherStorageEngine(FeatherFormat, CsvStorageEngine):
+    """Rewrites the full Feather file on every commit."""
+
+
+class FeatherLogStorageEngine(FeatherFormat, LogStorageEngine):
+    """Append-only change log on top of a Feather snapshot."""
+
+
+class ArchiveFile:
+    """
+    Append-only CSV file holding the records paged out of a table, read back in chunks.
+
+    Appends made before the table that dropped the records is committed are provisional:
+    begin() records the size of the archive in '<archive>.pending', every append lists the
+    keys it is about to write there, and settle(), called once the table is committed,
+    forgets it all. After a crash in between, recover() drops the provisional records
+    still found in the table and keeps the others, whose removal from the table was
+    committed, so every record is in exactly one of the two files.
+    """
+
+    def __init__(self, file_path: str, columns: list[str], key: str):
+        self.file_path = file_path
+        self.columns = columns
+        self.key = key
+        self.pending_path = f"{file_path}.pending"
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def size(self) -> int:
+        """Bytes written so far, readers can stop there to ignore later appends."""
+        return os.path.getsize(self.file_path) if self.exists() else 0
+
+    def is_pending(self) -> bool:
+        """Whether there are provisional appends."""
+        return os.path.exists(self.pending_path)
+
+    def begin(self):
+        """Mark the appends that follow as provisional until settle(), unless already marked."""
+        if self.is_pending():
+            return
+        with open(self.pending_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({'size': self.size()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def settle(self):
+        """The table was committed, the provisional appends are final."""
+        if self.is_pending():
+            os.remove(self.pending_path)
+
+    def _read_pending(self) -> tuple:
+        """Size of the archive when the provisional appends began, and the keys they list."""
+        with open(self.pending_path, encoding="utf-8") as f:
+            size = json.loads(f.readline())['size']
+            # A key line cut short by a crash names no record, the rows it announced were never written
+            keys = [line[:-1] for line in f if line.endswith("\n")]
+        return size, keys
+
+    def pending_keys(self) -> list:
+        """Keys of the provisional appends, empty when there are none."""
+        return self._read_pending()[1] if self.is_pending() else []
+
+    def recover(self, in_table=()):
+        """
+        Settle the provisional appends left by a crash. in_table holds the provisional keys still
+        found in the table: their copies in the archive are dropped, the table was not committed
+        without them. The other provisional records stay archived.
+        """
+        if not self.is_pending():
+            return
+        size, keys = self._read_pending()
+        committed = set(keys) - set(in_table)
+        # The records to keep are set aside before the archive is cut, a crash meanwhile finds them there
+        recovered_path = f"{self.file_path}.recovered"
+        if committed and not os.path.exists(recovered_path) and self.size() > size:
+            with open(self.file_path, "rb") as f:
+                # The tail only starts with the header when the provisional appends created the file
+                header = f.readline() if size else b""
+                f.seek(size)
+                rows = pd.read_csv(io.BytesIO(header + f.read()), dtype=object)
+            # Appends complete before the commit, a row cut short by the crash is one still in the table
+            rows = rows[rows[self.key].isin(committed)].drop_duplicates(self.key, keep='last')
+            tmp_path = f"{recovered_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                rows[self.columns].to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, recovered_path)
+        if size:
+            with open(self.file_path, "r+b") as f:
+                f.truncate(size)
+        elif self.exists():
+            os.remove(self.file_path)
+        if os.path.exists(recovered_path):
+            self._write(pd.read_csv(recovered_path, dtype=object))
+            os.remove(recovered_path)
+        self.settle()
+
+    def append(self, rows: pd.DataFrame):
+        if rows.empty:
+            return
+        if self.is_pending():
+            # Announced before they are written, recover() only keeps the rows it finds announced
+            with open(self.pending_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for key in rows[self.key]))
+                f.flush()
+                os.fsync(f.fileno())
+        self._write(rows)
+
+    def _write(self, rows: pd.DataFrame):
+        if rows.empty:
+            return
+        header = not self.exists()
+        with open(self.file_path, "a", encoding="utf-8", newline="") as f:
+            rows[self.columns].to_csv(f, index=False, header=header)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def iter_chunks(self, chunksize: int, size: int = None, usecols: list[str] = None):
+        """Records in chunks of chunksize rows, only the first size bytes of the file when given."""
+        size = self.size() if size is None else size
+        if not size:
+            return
+        with open(self.file_path, "rb") as f:
+            reader = io.BufferedReader(_BoundedReader(f, size))
+            with pd.read_csv(reader, dtype=object, chunksize=chunksize, usecols=usecols) as chunks:
+                yield from chunks
+
+    def max_key_number(self, prefix: str, chunksize: int = 500_000) -> int:
+        """Highest number among the archived keys of the form <prefix>-<number>, 0 when there is none."""
+        return max((max_key_number(chunk[self.key], prefix)
+                    for chunk in self.iter_chunks(chunksize, usecols=[self.key])), default=0)
+
+
+class _BoundedReader(io.RawIOBase):
+    """Raw reader over the first size bytes of a file."""
+
+    def __init__(self, f, size: int):
+        self._f = f
+        self._left = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._left <= 0:
+            return 0
+        n = self._f.readinto(memoryview(buffer)[:self._left])
+        self._left -= n
+        return n
+
+
+storage_engines = {
+    "csv": CsvStorageEngine,
+    "log": LogStorageEngine,
+    "feather": FeatherStorageEngine,
+    "feather-log": FeatherLogStorageEngine,
+}
+
+
+def _import_feather():
+    try:
+        from pyarrow import feather
+    except ImportError as e:
+        raise ImportError("The 'feather' storage engines need pyarrow: pip install pyarrow") from e
+    return feather
+
+
+def _json_default(value):
+    # numpy scalars (np.int64, np.float64, ...) expose .item()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
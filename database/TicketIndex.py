@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+import pandas as pd
+
+from automation.workload import active_statuses
+
+
+class TicketIndex:
+    """
+    Secondary indexes over the tickets table, kept up to date by EntityService on every mutation.
+
+    - by_status: status -> ticket IDs
+    - needs_triage: IDs of the Open tickets missing a category, priority or assignee
+    - active_by_assignee: assignee -> IDs of their tickets in one of the active statuses
+
+    Lets the watcher and the notifier work on the active tickets without scanning the closed history.
+    Each ticket's status, and assignee while active, is also kept by ID so forgetting a ticket only
+    touches its own buckets, whatever the number of statuses and assignees.
+    """
+
+    # Columns update() reads from the records
+    columns = ['ticket_id', 'status', 'assignee', 'category', 'priority']
+
+    def __init__(self):
+        self.by_status = defaultdict(set)
+        self.needs_triage = set()
+        self.active_by_assignee = defaultdict(set)
+        # ticket_id -> status, and -> assignee of the active tickets
+        self._status = {}
+        self._active_assignee = {}
+
+    def rebuild(self, tickets: pd.DataFrame):
+        """Index the whole table from scratch."""
+        self.by_status.clear()
+        self.needs_triage.clear()
+        self.active_by_assignee.clear()
+        self._status.clear()
+        self._active_assignee.clear()
+        if tickets.empty:
+            return
+
+        for status, ids in tickets.groupby('status', observed=True, sort=False)['ticket_id']:
+            self.by_status[status] = set(ids)
+            self._status.update(dict.fromkeys(ids, status))
+        open_tickets = tickets[tickets['status'] == 'Open']
+        self.needs_triage = set(open_tickets['ticket_id'][
+            open_tickets['category'].isnull() | open_tickets['priority'].isnull() | open_tickets['assignee'].isnull()
+        ])
+        active = tickets[tickets['status'].isin(active_statuses) & ~tickets['assignee'].isnull()]
+        for assignee, ids in active.groupby('assignee', observed=True, sort=False)['ticket_id']:
+            self.active_by_assignee[assignee] = set(ids)
+            self._active_assignee.update(dict.fromkeys(ids, assignee))
+
+    def update(self, tickets: list):
+        """Re-index the given (inserted or updated) tickets, dicts with their current values of the index columns."""
+        self.remove(ticket['ticket_id'] for ticket in tickets)
+        for ticket in tickets:
+            ticket_id, status, assignee, category, priority = (ticket[col] for col in self.columns)
+            if pd.isnull(status):
+                continue
+            self.by_status[status].add(ticket_id)
+            self._status[ticket_id] = status
+            if status == 'Open' and (pd.isnull(category) or pd.isnull(priority) or pd.isnull(assignee)):
+                self.needs_triage.add(ticket_id)
+            if status in active_statuses and not pd.isnull(assignee):
+                self.active_by_assignee[assignee].add(ticket_id)
+                self._active_assignee[ticket_id] = assignee
+
+    def remove(self, ticket_ids):
+        """Forget the given (deleted or archived) tickets."""
+        for ticket_id in ticket_ids:
+            self.needs_triage.discard(ticket_id)
+            for buckets, names in ((self.by_status, self._status), (self.active_by_assignee, self._active_assignee)):
+                name = names.pop(ticket_id, None)
+                if name is None:
+                    continue
+                bucket = buckets[name]
+                bucket.discard(ticket_id)
+                if not bucket:
+                    del buckets[name]
+
+    def active_ids(self, assignees=None) -> set:
+        """IDs of the active tickets of the given assignees, of every assignee by default."""
+        names = self.active_by_assignee if assignees is None else assignees
+        return set().union(*(self.active_by_assignee.get(name, ()) for name in names))
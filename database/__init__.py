@@ -1 +1,2 @@
-from database.JiraService import JiraMockService
\ No newline at end of file
+from database.JiraService import JiraMockService
+from database.Records import Ticket, User
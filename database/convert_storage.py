@@ -0,0 +1,25 @@
+"""
+One-shot conversion of the ticket and user tables from one storage engine to another.
+
+Usage: python -m database.convert_storage [target engine] [source engine]
+e.g. python -m database.convert_storage feather csv
+"""
+import sys
+
+from database.JiraService import JiraMockService
+from database.StorageEngine import storage_engines
+
+
+def convert_storage(target: str = 'feather', source: str = 'csv', tickets_file: str = "database/jira_tickets.csv",
+                    users_file: str = 'database/jira_users.csv'):
+    """Load both tables through the source engine and write them as a fresh snapshot of the target engine."""
+    jira = JiraMockService(tickets_file, users_file, auto_save=False, storage=source)
+    for service in (jira.tickets_service, jira.users_service):
+        engine = storage_engines[target](service.file_path, service.columns, service.key, service.storage.categorical)
+        # Log engines: the converted table becomes the snapshot, with an empty log
+        engine.rewrite(service.data)
+        print(f"Converted {len(service.data)} rows from {service.storage.file_path} to {engine.file_path}")
+
+
+if __name__ == "__main__":
+    convert_storage(*sys.argv[1:3])
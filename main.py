@@ -1,25 +1,86 @@
-import numpy as np
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
-from threading import Thread, Event, Lock
+from threading import Thread, Event
 import time
 
-from automation import predict_category, predict_priority, assign_ticket
-from database import JiraMockService
-from notifications.summary_email import summary_tickets_email
+from automation import predict_category, predict_priority, triage_batch, TriageScheduler, WorkloadTracker
+from database import JiraMockService, Ticket
+from monitoring import registry
+from notifications.dispatch import EmailDispatcher, SMTPPool
+from notifications.summary_email import summary_tickets_email, summarized_tickets
+
+
+# Fields the triage fills in, the only ones written back
+triage_fields = ('category', 'priority', 'assignee')
 
 
 class TicketWatcher:
-    def __init__(self, interval: int = 5, notification_mail_interval=10):
-        self.jira = JiraMockService()
+    def __init__(self, interval: int = 5, notification_mail_interval=10, storage: str = 'csv', batch_mode=True,
+                 jira: JiraMockService = None, metrics_port: int = None, metrics_file: str = None,
+                 metrics_interval=10, workers: int = None, chunk_size: int = 5000, batch_size: int = 1000,
+                 cycle_budget: float = 1.0, aging: float = 3600, dispatcher: EmailDispatcher = None,
+                 model_path: str = None):
+        """
+        metrics_port serves the metrics in Prometheus text format on http://127.0.0.1:<port>/metrics
+        (and as JSON on /metrics.json), metrics_file dumps them as JSON every metrics_interval seconds.
+
+        workers > 0 categorizes and prioritizes batches on a pool of that many processes, in chunks of
+        chunk_size tickets. Assignment stays in the watcher so the load balancing remains global.
+
+        Pending tickets go through a TriageScheduler, most urgent first (see aging there), and are triaged in
+        batches of batch_size until cycle_budget seconds are spent. The rest waits for the next pass, which
+        starts right away and sees the tickets created meanwhile. cycle_budget None triages the whole backlog
+        in every pass.
+
+        With a dispatcher, the summaries that changed are also emailed to the assignees, it is closed
+        (flushing what is queued) on stop.
+
+        model_path predicts categories and priorities with the learned model saved there (python -m
+        automation.model train) instead of the keyword rules, in batch mode only. It is loaded on first use
+        and reloaded when the file changes.
+        """
+        if model_path and not batch_mode:
+            raise ValueError("model_path needs batch_mode")
+        # Checked here rather than failing in the watch thread, only the loading waits for the first batch
+        if model_path and not os.path.isfile(model_path):
+            raise FileNotFoundError(f"No model at {model_path}, train one with python -m automation.model train")
+        self.jira = jira if jira else JiraMockService(storage=storage)
         self.interval = interval
+        self.batch_mode = batch_mode
         self.notification_mail_interval = notification_mail_interval
+        # Change feed versions already handled by each loop, None until their first full pass
+        self._watch_version = None
+        self._notify_version = None
+        self._workload = None
+        self._notified = {}
+        self.scheduler = TriageScheduler(aging)
+        self.batch_size = batch_size
+        self.cycle_budget = cycle_budget
+        self.dispatcher = dispatcher
+        self.chunk_size = chunk_size
+        self.model_path = model_path
+        # Workers forked from a server process: forking this one, with its threads and their locks, is unsafe
+        self._triage_executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('forkserver')) \
+            if workers else None
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self._metrics_server = None
+        self._metrics_dump = None
         self._stop_event = Event()
         self._thread = Thread(target=self._watch_loop)
         self._thread2 = Thread(target=self._notify_loop)
-        self.lock = Lock()
 
     def start(self):
         print("TicketWatcher started.")
+        if self.metrics_port is not None:
+            self._metrics_server = registry.serve(self.metrics_port)
+        if self.metrics_file:
+            self._metrics_dump = registry.dump_periodically(self.metrics_file, self.metrics_interval)
         self._thread.start()
         self._thread2.start()
 
@@ -27,77 +88,368 @@ class TicketWatcher:
         self._stop_event.set()
         self._thread.join()
         self._thread2.join()
+        if self._triage_executor:
+            self._triage_executor.shutdown()
+        if self.dispatcher:
+            self.dispatcher.close()
+        if self._metrics_server:
+            self._metrics_server.shutdown()
+        if self._metrics_dump:
+            self._metrics_dump.set()
         print("TicketWatcher stopped.")
 
     def _watch_loop(self):
         """
         Watch for every ticket in status Open, that requires being categorized, prioritized and assigned
         """
+        cycle = registry.histogram('ticket_watcher_cycle_seconds', loop='watch')
         while not self._stop_event.is_set():
-            with self.lock:
-                users = self.jira.get_all_users()
-                tickets = self.jira.get_all_tickets()
-
-                pending_tickets = tickets[
-                    (tickets['status'] == 'Open') &
-                    (tickets['category'].isnull() | tickets['priority'].isnull() | tickets['assignee'].isnull())
-                ]
-
-                if pending_tickets.empty:
-                    print(f"No ticket(s) found to be categorized, prioritized or assigned.")
-                else:
-                    for idx in pending_tickets.index:
-                        ticket = pending_tickets.loc[idx].to_dict()
-
-                        # Assign category, priority and assignee
-                        if ticket['category'] is None or np.isnan(ticket['category']):
-                            ticket['category'] = categorizeTicket(ticket)
-                        if ticket['priority'] is None or np.isnan(ticket['priority']):
-                            ticket['priority'] = prioritizeTicket(ticket)
-                        if ticket['assignee'] is None or np.isnan(ticket['assignee']):
-                            tickets_being_worked = tickets[
-                                (tickets['status'].isin(['Open', 'In Progress', 'Waiting for User'])) &
-                                (~tickets['assignee'].isnull())
-                                ]
-                            ticket['assignee'] = assignTicket(tickets_being_worked, users)
-
-                        ticket_id = ticket['ticket_id']
-                        ticket = self.jira.update_ticket(ticket_id, ticket)
-                        # tickets.loc[tickets['ticket_id'] == ticket['ticket_id'], :] = pd.DataFrame([ticket])
-
-                        print(f"Processed ticket {ticket_id}, assigned to {ticket['assignee']}")
-                    print(f"Processed {len(pending_tickets)} ticket(s).")
-
+            start = time.perf_counter()
+            self._watch_pass()
+            cycle.observe(time.perf_counter() - start)
 
+            if self.scheduler:
+                # Backlog left over by the cycle budget, go on after a look at the new tickets
+                continue
             print(f"Sleeping for {self.interval} seconds.")
-            time.sleep(self.interval)
+            # Wakes up as soon as stop() is called
+            self._stop_event.wait(self.interval)
+
+    def _watch_pass(self):
+        """
+        One triage pass: queue the tickets changed since the last one, then triage the most urgent queued
+        tickets within the cycle budget. Returns the number of tickets triaged, None when nothing changed.
+        """
+        # Reads the indexes and the queued tickets only, a snapshot of the whole tickets table would make every
+        # write of the pass copy the columns it touches
+        version = self.jira.version
+        if version == self._watch_version and not self.scheduler:
+            print(f"No changes since the last pass.")
+            return None
+
+        users = self.jira.get_all_users()
+        if version != self._watch_version:
+            self.scheduler.push(self._collect_pending(users))
+        registry.gauge('ticket_watcher_pending_tickets').set(len(self.scheduler))
+
+        start = time.perf_counter()
+        processed = 0
+        while self.scheduler:
+            if self.cycle_budget is not None and processed and time.perf_counter() - start >= self.cycle_budget:
+                break
+            ticket_ids = self.scheduler.pop(self.batch_size if self.cycle_budget is not None else None)
+            # Re-read, the queued tickets may have been changed (or triaged by hand) since they were queued.
+            # Those changed after this version are left to the change feed of the next pass.
+            batch_version = self.jira.version
+            pending_tickets = _needs_triage(self.jira.find_tickets_by_ids(ticket_ids))
+            self.scheduler.forget(set(ticket_ids) - set(pending_tickets['ticket_id']))
+            if pending_tickets.empty:
+                continue
+            # The workload was seeded by _collect_pending, the triage does not need the whole table
+            if self.batch_mode:
+                self._triage_batch(pending_tickets, None, users, batch_version)
+            else:
+                self._triage_per_ticket(pending_tickets, None, users)
+            processed += len(pending_tickets)
+
+        if processed:
+            registry.counter('ticket_watcher_tickets_processed_total').inc(processed)
+            print(f"Processed {processed} ticket(s), {len(self.scheduler)} left in the queue.")
+        else:
+            print(f"No ticket(s) found to be categorized, prioritized or assigned.")
+
+        # Our own updates come back through the change feed on the next pass, as a no-op
+        self._watch_version = version
+        return processed
+
+    def _collect_pending(self, users: pd.DataFrame) -> pd.DataFrame:
+        """
+        Tickets to triage: every ticket needing it on the first pass (or after users change), then only the ones
+        changed since. Both read the service indexes, not the whole table, so closed tickets cost nothing.
+        """
+        if self._watch_version is None or self.jira.user_changes_since(self._watch_version):
+            self._workload = WorkloadTracker.from_tickets(self.jira.find_active_tickets(), users['name'])
+            candidates = self.jira.find_tickets_needing_triage()
+        else:
+            changed = self.jira.ticket_changes_since(self._watch_version)
+            candidates = self.jira.find_tickets_by_ids(changed)
+            for ticket_id in set(changed) - set(candidates['ticket_id']):
+                self._workload.remove(ticket_id)
+            for ticket_id, assignee, priority, status in zip(candidates['ticket_id'], candidates['assignee'],
+                                                             candidates['priority'], candidates['status']):
+                self._workload.update(ticket_id, assignee, priority, status)
+
+        return _needs_triage(candidates)
+
+    def _triage_batch(self, pending_tickets: pd.DataFrame, tickets: pd.DataFrame, users: pd.DataFrame,
+                      version: int = None):
+        """
+        Categorize, prioritize and assign the whole pending set at once and write it back with one update.
+        Tickets changed after the version the pending set was read at are left for the next pass.
+        """
+        triaged = triage_batch(pending_tickets, tickets, users, self._workload, self._triage_executor, self.chunk_size,
+                               self.model_path)
+        updates = triaged.set_index('ticket_id').to_dict(orient='index')
+        with registry.timer('ticket_watcher_stage_seconds', stage='update_ticket'):
+            applied = self.jira.update_tickets(updates, unchanged_since=version)
+        self.scheduler.assigned({ticket_id: ticket['priority'] for ticket_id, ticket in applied.items()})
+
+    def _triage_per_ticket(self, pending_tickets: pd.DataFrame, tickets: pd.DataFrame, users: pd.DataFrame):
+        """
+        Categorize, prioritize and assign the pending tickets one by one
+        """
+        # Seeded once instead of recomputed for every unassigned ticket
+        workload = self._workload if self._workload else WorkloadTracker.from_tickets(tickets, users['name'])
+
+        # Commit the whole pass at once instead of saving after every ticket
+        with self.jira.batch():
+            # Converted column by column up front, then only the fields filled in are written back
+            for ticket in Ticket.from_frame(pending_tickets):
+                # Assign category, priority and assignee
+                if ticket.category is None:
+                    with registry.timer('ticket_watcher_stage_seconds', stage='categorize'):
+                        ticket.category = categorizeTicket(ticket)
+                if ticket.priority is None:
+                    with registry.timer('ticket_watcher_stage_seconds', stage='prioritize'):
+                        ticket.priority = prioritizeTicket(ticket)
+                if ticket.assignee is None:
+                    with registry.timer('ticket_watcher_stage_seconds', stage='assign'):
+                        ticket.assignee = workload.next_assignee()
+
+                with registry.timer('ticket_watcher_stage_seconds', stage='update_ticket'):
+                    self.jira.update_ticket(ticket.ticket_id, ticket.to_dict(triage_fields))
+                self.scheduler.assigned({ticket.ticket_id: ticket.priority})
+                workload.update(ticket.ticket_id, ticket.assignee, ticket.priority, ticket.status)
+
+                print(f"Processed ticket {ticket.ticket_id}, assigned to {ticket.assignee}")
 
     def _notify_loop(self):
         """
         Sends Summary of Pending Tickets to every user in HTML format
         """
+        cycle = registry.histogram('ticket_watcher_cycle_seconds', loop='notify')
         while not self._stop_event.is_set():
-            with self.lock:
-                tickets = pd.DataFrame(self.jira.get_all_tickets())
-                summary_tickets_email(tickets)
+            start = time.perf_counter()
+            self._notify_pass()
+            cycle.observe(time.perf_counter() - start)
+            self._stop_event.wait(self.notification_mail_interval)
+
+    def _notify_pass(self):
+        """Refresh the summaries of the assignees whose tickets changed since the last pass."""
+        # Renders the active tickets only, read from the indexes, without holding any lock while rendering.
+        # The version is read first: changes racing with the reads are simply rendered again on the next pass.
+        version = self.jira.version
+        if version != self._notify_version:
+            assignees = self._assignees_to_notify()
+            if assignees is None or assignees:
+                addresses = None
+                if self.dispatcher:
+                    users = self.jira.get_all_users()
+                    addresses = dict(zip(users['name'], users['email']))
+                with registry.timer('ticket_watcher_stage_seconds', stage='render'):
+                    summary_tickets_email(self.jira.find_active_tickets(assignees), assignees,
+                                          dispatcher=self.dispatcher, addresses=addresses)
                 print(f"Notification sent to assignees")
-                time.sleep(self.notification_mail_interval)
+            self._notify_version = version
 
+    def _assignees_to_notify(self):
+        """
+        Assignees whose summarized tickets changed since the last notification, None to notify everybody
+        """
+        if self._notify_version is None:
+            summarized = summarized_tickets(self.jira.find_active_tickets())
+            self._notified = dict(zip(summarized['ticket_id'], summarized['assignee']))
+            return None
+
+        changed = self.jira.ticket_changes_since(self._notify_version)
+        summarized = summarized_tickets(self.jira.find_tickets_by_ids(changed))
+
+        # Both the previous and the current assignee of a changed ticket get a fresh summary
+        assignees = {self._notified.pop(ticket_id) for ticket_id in changed if ticket_id in self._notified}
+        for ticket_id, assignee in zip(summarized['ticket_id'], summarized['assignee']):
+            self._notified[ticket_id] = assignee
+            assignees.add(assignee)
+        return assignees
+
+
+class AsyncTicketWatcher(TicketWatcher):
+    """
+    TicketWatcher on an asyncio event loop instead of two sleeping threads.
+
+    Triage, notification and persistence run as cooperating tasks and their CPU-bound work
+    (triage passes, rendering, saving) runs on an executor. The triage poll interval
+    halves while there is a backlog, down to min_interval, and doubles while idle, up to
+    interval. While running, the persistence task owns saving: jira.auto_save is turned off
+    and changes are saved right after each triage batch and otherwise every persist_interval
+    seconds. stop() lets in-flight passes finish and flushes unsaved changes, giving up on
+    what is still running after shutdown_timeout seconds.
+    """
+
+    def __init__(self, interval: float = 5, notification_mail_interval=10, storage: str = 'csv',
+                 jira: JiraMockService = None, min_interval: float = 0.1, persist_interval: float = 1,
+                 shutdown_timeout: float = 5, executor: Executor = None, **kwargs):
+        super().__init__(interval, notification_mail_interval, storage, batch_mode=True, jira=jira, **kwargs)
+        self.min_interval = min(min_interval, interval)
+        self.persist_interval = persist_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.executor = executor if executor else ThreadPoolExecutor(max_workers=3, thread_name_prefix="watcher")
+        # Current triage poll interval, adapted to the backlog
+        self.poll_interval = interval
+        self._loop = None
+        self._started = None
+        self._stopping = None
+        self._dirty = None
+        self._thread = Thread(target=lambda: asyncio.run(self.run()), name="watcher-loop")
+
+    def start(self):
+        """Run the event loop on a background thread, see run() to use an existing loop."""
+        self._started = Event()
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        """Stop the tasks and wait for the final flush. Safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join()
+
+    async def run(self):
+        """Run until stop() (or a failed task), then flush."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._dirty = asyncio.Event()
+        auto_save, self.jira.auto_save = self.jira.auto_save, False
+        print("TicketWatcher started.")
+        if self.metrics_port is not None:
+            self._metrics_server = registry.serve(self.metrics_port)
+        if self.metrics_file:
+            self._metrics_dump = registry.dump_periodically(self.metrics_file, self.metrics_interval)
+        if self._started:
+            self._started.set()
 
-def categorizeTicket(ticket: dict) -> str:
+        tasks = [asyncio.create_task(coroutine) for coroutine in
+                 (self._triage_task(), self._notify_task(), self._persist_task())]
+        stopping = asyncio.create_task(self._stopping.wait())
+        await asyncio.wait([stopping, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        self._stopping.set()
+
+        deadline = self._loop.time() + self.shutdown_timeout
+        _, unfinished = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+        for task in unfinished:
+            print(f"Gave up waiting for {task.get_coro().__name__} on shutdown.")
+            task.cancel()
+        try:
+            await asyncio.wait_for(self._in_executor(self._flush), max(deadline - self._loop.time(), 0.1))
+        except asyncio.TimeoutError:
+            print("Final save did not finish before the shutdown deadline.")
+        finally:
+            self.jira.auto_save = auto_save
+            if self._triage_executor:
+                self._triage_executor.shutdown(wait=False, cancel_futures=True)
+            if self.dispatcher:
+                await self._in_executor(self.dispatcher.close, max(deadline - self._loop.time(), 0.1))
+            if self._metrics_server:
+                self._metrics_server.shutdown()
+            if self._metrics_dump:
+                self._metrics_dump.set()
+        print("TicketWatcher stopped.")
+
+        # A task that failed is reported once everything is flushed
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception():
+                raise task.exception()
+
+    def _in_executor(self, func, *args):
+        return self._loop.run_in_executor(self.executor, func, *args)
+
+    async def _wait_for_stop(self, seconds: float) -> bool:
+        """Sleep up to the given seconds, returns True as soon as a stop is requested."""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _triage_task(self):
+        cycle = registry.histogram('ticket_watcher_cycle_seconds', loop='watch')
+        backlog = 0
+        while not self._stopping.is_set():
+            start = time.perf_counter()
+            triaged = await self._in_executor(self._watch_pass)
+            cycle.observe(time.perf_counter() - start)
+            if triaged:
+                self._dirty.set()
+            backlog = self._adapt_interval(triaged, backlog)
+            if await self._wait_for_stop(self.poll_interval):
+                break
+
+    def _adapt_interval(self, triaged, backlog: int) -> int:
+        """Tighten the poll interval while tickets keep coming, back off while idle. Returns the new backlog."""
+        if not triaged:
+            self.poll_interval = min(self.interval, self.poll_interval * 2)
+            return 0
+        if triaged > backlog or self.scheduler:
+            # Backlog growing or left over by the cycle budget, poll as fast as allowed
+            self.poll_interval = self.min_interval
+        else:
+            self.poll_interval = max(self.min_interval, self.poll_interval / 2)
+        return triaged
+
+    async def _notify_task(self):
+        cycle = registry.histogram('ticket_watcher_cycle_seconds', loop='notify')
+        while not self._stopping.is_set():
+            start = time.perf_counter()
+            await self._in_executor(self._notify_pass)
+            cycle.observe(time.perf_counter() - start)
+            if await self._wait_for_stop(self.notification_mail_interval):
+                break
+
+    async def _persist_task(self):
+        while not self._stopping.is_set():
+            # Woken early by a triage batch, a stop or the periodic save
+            waiters = [asyncio.create_task(self._dirty.wait()), asyncio.create_task(self._stopping.wait())]
+            await asyncio.wait(waiters, timeout=self.persist_interval, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+            self._dirty.clear()
+            if not self._stopping.is_set():
+                await self._in_executor(self._flush)
+
+    def _flush(self):
+        if self.jira.has_unsaved_changes():
+            self.jira.save()
+
+
+def _needs_triage(tickets: pd.DataFrame) -> pd.DataFrame:
+    """Open tickets missing a category, a priority or an assignee."""
+    return tickets[
+        (tickets['status'] == 'Open') &
+        (tickets['category'].isnull() | tickets['priority'].isnull() | tickets['assignee'].isnull())
+    ]
+
+
+def categorizeTicket(ticket: Ticket) -> str:
     return predict_category(ticket['summary'], ticket['description'])
 
-def prioritizeTicket(ticket: dict) -> str:
+def prioritizeTicket(ticket: Ticket) -> str:
     return predict_priority(ticket['summary'], ticket['description'], ticket['category'])
 
-def assignTicket(tickets: pd.DataFrame, users: pd.DataFrame) -> str:
-    return assign_ticket(tickets, users)
-
 # Usage Example
 if __name__ == "__main__":
 
-    # Process tickets every 10 seconds
-    watcher = TicketWatcher(interval=10, notification_mail_interval=30)
+    # Process tickets every 10 seconds, or on the event loop with adaptive polling when run with --async.
+    # --smtp host:port also emails the summaries through that server (python -m notifications.local_smtp).
+    # --model path triages with the learned model saved there (python -m automation.model train).
+    dispatcher = None
+    if "--smtp" in sys.argv:
+        host, _, port = sys.argv[sys.argv.index("--smtp") + 1].partition(":")
+        dispatcher = EmailDispatcher(SMTPPool(host, int(port) if port else 25), sender="it-support@localhost")
+    model_path = sys.argv[sys.argv.index("--model") + 1] if "--model" in sys.argv else None
+    if "--async" in sys.argv:
+        watcher = AsyncTicketWatcher(interval=10, notification_mail_interval=30, dispatcher=dispatcher,
+                                     model_path=model_path)
+    else:
+        watcher = TicketWatcher(interval=10, notification_mail_interval=30, dispatcher=dispatcher,
+                                model_path=model_path)
     watcher.start()
 
     try:
@@ -0,0 +1 @@
+from monitoring.metrics import Counter, Gauge, Histogram, Metrics, TimedLock, registry
\ No newline at end of file
@@ -0,0 +1,269 @@
+import bisect
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+
+# Upper bounds in seconds, from sub-millisecond lock waits to full-table rewrites
+default_buckets = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self._lock = Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def to_dict(self) -> dict:
+        return {'value': self.value}
+
+
+class Gauge:
+    """Value that goes up and down, the last one set wins."""
+
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def to_dict(self) -> dict:
+        return {'value': self.value}
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, Prometheus style.
+
+    Observing costs a bisect and three increments under a lock. Quantiles are estimated
+    by interpolating inside the bucket they fall in.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = Lock()
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float):
+        """Estimated q-quantile (0 < q < 1), None before any observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            counts = list(self.counts)
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                'buckets': buckets}
+
+
+class Timer:
+    """Times a with block into a histogram, a plain class is cheaper than a generator context manager."""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and histograms, each identified by a name and optional labels.
+
+    Exposes them as Prometheus text (render_prometheus, serve) or as JSON (to_dict, dump_periodically).
+    """
+
+    def __init__(self, descriptions: dict = None):
+        self._lock = Lock()
+        self._metrics = {}
+        self._help = dict(descriptions) if descriptions else {}
+
+    def _get(self, cls, name: str, help: str, labels: dict, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(**kwargs)
+                    if help:
+                        self._help[name] = help
+        return metric
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str = "", buckets=default_buckets, **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def timer(self, name: str, **labels) -> "Timer":
+        """Context manager observing the duration of the block, in seconds, into the histogram name."""
+        return Timer(self.histogram(name, **labels))
+
+    def _items(self) -> list:
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    def render_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for (name, labels), metric in self._items():
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+            if metric.kind == "histogram":
+                for bound, cumulative in metric.to_dict()['buckets'].items():
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {metric.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {metric.count}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        """Every metric as name -> list of {labels, values}, ready for json.dumps."""
+        result = {}
+        for (name, labels), metric in self._items():
+            result.setdefault(name, []).append({'labels': dict(labels), **metric.to_dict()})
+        return result
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Serve /metrics (Prometheus text) and /metrics.json from a daemon thread. Returns the server,
+        call shutdown() on it to stop.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.render_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(registry.to_dict()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+        return server
+
+    def dump(self, path: str):
+        """Write the metrics as JSON through a temporary file and a rename."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def dump_periodically(self, path: str, interval: float) -> Event:
+        """Dump to path every interval seconds from a daemon thread, until the returned event is set."""
+        stop = Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.dump(path)
+            self.dump(path)
+
+        Thread(target=loop, daemon=True, name="metrics-dump").start()
+        return stop
+
+
+class TimedLock:
+    """Wraps a Lock/RLock and records how long every acquisition waited into a histogram."""
+
+    def __init__(self, lock, histogram: Histogram):
+        self._inner = lock
+        self._histogram = histogram
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self._inner.acquire(blocking, timeout)
+        self._histogram.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._inner.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Process-wide registry used by the watcher, the services and the automation helpers
+registry = Metrics({
+    'ticket_watcher_cycle_seconds': "Duration of one pass of the watch or notify loop.",
+    'ticket_watcher_stage_seconds': "Duration of one pipeline stage: categorize, prioritize (or classify "
+                                    "when sharded), assign, update_ticket, save or render.",
+    'ticket_watcher_lock_wait_seconds': "Time spent waiting to acquire a JiraMockService lock.",
+    'ticket_watcher_tickets_processed_total': "Tickets categorized, prioritized and assigned.",
+    'ticket_watcher_pending_tickets': "Tickets waiting for triage at the start of the last watch pass.",
+    'ticket_watcher_emails_total': "Summary emails by outcome: sent, unchanged or coalesced (not sent again), "
+                                   "retried or failed.",
+    'ticket_watcher_smtp_connections_total': "SMTP connections opened by the dispatch pool.",
+    'ticket_watcher_time_to_assignment_seconds': "Time from a ticket's creation to its triage, by final priority.",
+})
@@ -0,0 +1,328 @@
+import hashlib
+import heapq
+import itertools
+import smtplib
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.mime.text import MIMEText
+from queue import Full
+from threading import Condition, Lock, Thread
+
+from monitoring import registry
+
+
+def build_message(sender: str, recipient: str, subject: str, html: str) -> bytes:
+    """
+    Single part HTML email. The compat32 MIMEText builds it several times faster than EmailMessage with a
+    plain text alternative, which would dominate the cost of a send over a pooled connection.
+    """
+    message = MIMEText(html, "html", "utf-8")
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = recipient
+    return message.as_bytes()
+
+
+class SMTPPool:
+    """
+    Up to size persistent SMTP connections shared by every sender.
+
+    A connection is opened on first need and handed back after use instead of being closed. One that
+    sat idle for more than check_after seconds is checked with a NOOP before reuse, and one that
+    failed is closed and dropped, the next sender opens a fresh one.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 25, size: int = 4, timeout: float = 10,
+                 starttls: bool = False, username: str = None, password: str = None, check_after: float = 30):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.check_after = check_after
+        self._available = Condition(Lock())
+        # (connection, last used) of the idle connections, the most recently used last
+        self._idle = []
+        self._open = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                connection.starttls()
+            if self.username:
+                connection.login(self.username, self.password)
+        except Exception:
+            connection.close()
+            raise
+        registry.counter('ticket_watcher_smtp_connections_total').inc()
+        return connection
+
+    def _take(self) -> smtplib.SMTP:
+        with self._available:
+            while not self._idle and self._open >= self.size:
+                self._available.wait()
+            if not self._idle:
+                self._open += 1
+                connection = None
+            else:
+                connection, last_used = self._idle.pop()
+        if connection is None:
+            try:
+                return self._connect()
+            except Exception:
+                self._discard(None)
+                raise
+        if time.monotonic() - last_used > self.check_after:
+            try:
+                connection.noop()
+            except (smtplib.SMTPException, OSError):
+                self._discard(connection)
+                return self._take()
+        return connection
+
+    def _discard(self, connection):
+        if connection is not None:
+            connection.close()
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """A connection of the pool for the block, dropped instead of reused when the block fails on it."""
+        connection = self._take()
+        try:
+            yield connection
+        except BaseException:
+            self._discard(connection)
+            raise
+        with self._available:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+    def close(self):
+        """QUIT every idle connection."""
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for connection, _ in idle:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+
+
+class _Email:
+    __slots__ = ('key', 'recipient', 'subject', 'html', 'digest', 'generation', 'attempts')
+
+    def __init__(self, key, recipient: str, subject: str, html: str, digest: str, generation: int):
+        self.key = key
+        self.recipient = recipient
+        self.subject = subject
+        self.html = html
+        self.digest = digest
+        self.generation = generation
+        self.attempts = 0
+
+
+class EmailDispatcher:
+    """
+    Sends HTML emails from a bounded outbound queue, on worker threads sharing an SMTPPool.
+
+    - Coalescing: emails are keyed (by assignee for the summaries). Submitting an email whose content
+      matches the last one sent for its key, with nothing newer pending, is a no-op. Submitting again
+      supersedes the previous email of the key: it is replaced while queued, and dropped instead of
+      sent or retried once it is no longer the latest, so only the latest content is sent last.
+    - Batching: each worker takes up to batch_size emails at a time and sends them over one connection.
+    - Retries: temporary failures (4xx replies, lost connections) are retried up to max_attempts times,
+      after backoff seconds doubling with every attempt up to max_backoff. 4xx recipient refusals, such
+      as greylisting, are temporary too. Permanent (5xx) failures are dropped. Outcomes are counted in ticket_watcher_emails_total.
+
+    submit blocks while max_queue emails are waiting, up to its timeout.
+    """
+
+    def __init__(self, pool: SMTPPool, sender: str, max_queue: int = 10_000, batch_size: int = 100,
+                 workers: int = None, max_attempts: int = 5, backoff: float = 0.5, max_backoff: float = 30):
+        self.pool = pool
+        self.sender = sender
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._cond = Condition(Lock())
+        # key -> email ready to go, in submission order
+        self._ready = OrderedDict()
+        # (due time, seq, email) of the emails waiting for a retry
+        self._retries = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        # key -> digest of the last email sent, and -> (generation, digest) of the last one submitted
+        self._sent = {}
+        self._latest = {}
+        self._generations = itertools.count()
+        self._closing = False
+        self._workers = [Thread(target=self._work, daemon=True, name=f"email-dispatch-{i}")
+                         for i in range(workers if workers else pool.size)]
+        for worker in self._workers:
+            worker.start()
+
+    def _count(self, outcome: str, amount: int = 1):
+        registry.counter('ticket_watcher_emails_total', outcome=outcome).inc(amount)
+
+    def _queued(self) -> int:
+        return len(self._ready) + len(self._retries) + self._in_flight
+
+    def submit(self, key, recipient: str, subject: str, html: str, timeout: float = None) -> bool:
+        """
+        Queue an email. Returns False when the same content was already sent for this key. Raises
+        queue.Full when the queue stays full for timeout seconds.
+        """
+        digest = hashlib.sha256(f"{recipient}\n{subject}\n{html}".encode("utf-8")).hexdigest()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            latest = self._latest.get(key)
+            if self._sent.get(key) == digest and latest is not None and latest[1] == digest:
+                self._count('unchanged')
+                return False
+            if key in self._ready:
+                self._count('coalesced')
+            else:
+                while self._queued() >= self.max_queue:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise Full(f"{self._queued()} emails waiting to be sent")
+                    self._cond.wait(remaining)
+            generation = next(self._generations)
+            self._latest[key] = (generation, digest)
+            self._ready[key] = _Email(key, recipient, subject, html, digest, generation)
+            self._cond.notify_all()
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued email was sent or given up on. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queued():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = None):
+        """Send what is queued (up to timeout seconds), then stop the workers and close the connections."""
+        self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self.pool.close()
+
+    def _take_batch(self) -> list:
+        """Up to batch_size emails to send, waiting for some. Empty list when closing."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._retries and self._retries[0][0] <= now and len(self._ready) < self.batch_size:
+                    _, _, email = heapq.heappop(self._retries)
+                    # A newer email of the same key, queued or already sent, supersedes the one being retried
+                    if self._is_latest(email):
+                        self._ready[email.key] = email
+                    else:
+                        self._count('coalesced')
+                        # Fewer emails queued, flush() may be waiting for none
+                        self._cond.notify_all()
+                if self._ready:
+                    batch = [self._ready.popitem(last=False)[1]
+                             for _ in range(min(self.batch_size, len(self._ready)))]
+                    self._in_flight += len(batch)
+                    return batch
+                if self._closing:
+                    return []
+                self._cond.wait(self._retries[0][0] - now if self._retries else None)
+
+    def _work(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            sent = 0
+            try:
+                with self.pool.connection() as connection:
+                    for email in batch:
+                        self._send(connection, email)
+                        sent += 1
+            except (smtplib.SMTPException, OSError):
+                # The connection is gone, what was left of the batch goes through the retries
+                for email in batch[sent:]:
+                    self._retry(email)
+                with self._cond:
+                    self._in_flight -= len(batch) - sent
+                    self._cond.notify_all()
+
+    def _is_latest(self, email: _Email) -> bool:
+        """Whether no newer email was submitted for the key. Called with the lock held."""
+        return self._latest[email.key][0] == email.generation
+
+    def _send(self, connection: smtplib.SMTP, email: _Email):
+        with self._cond:
+            latest = self._is_latest(email)
+        if not latest:
+            # Superseded while waiting in the batch, the newer email is sent instead
+            self._count('coalesced')
+            self._done()
+            return
+        message = build_message(self.sender, email.recipient, email.subject, email.html)
+        try:
+            connection.sendmail(self.sender, [email.recipient], message)
+        except smtplib.SMTPResponseException as e:
+            # Failed on its own, the connection stays usable
+            if 400 <= e.smtp_code < 500:
+                self._retry(email)
+            else:
+                self._count('failed')
+            self._reset(connection)
+        except smtplib.SMTPRecipientsRefused as e:
+            # 4xx refusals (greylisting) are temporary like any other 4xx reply
+            if all(400 <= code < 500 for code, _ in e.recipients.values()):
+                self._retry(email)
+            else:
+                self._count('failed')
+            self._reset(connection)
+        else:
+            self._count('sent')
+            with self._cond:
+                self._sent[email.key] = email.digest
+        self._done()
+
+    def _done(self):
+        """One email of a batch is settled, sent, dropped or scheduled for a retry."""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @staticmethod
+    def _reset(connection: smtplib.SMTP):
+        # A dead connection shows up on the next send of the batch
+        try:
+            connection.rset()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def _retry(self, email: _Email):
+        """Schedule the email for another attempt, or give up on it. The caller settles its in-flight count."""
+        email.attempts += 1
+        with self._cond:
+            if email.attempts >= self.max_attempts:
+                self._count('failed')
+                return
+            self._count('retried')
+            delay = min(self.backoff * 2 ** (email.attempts - 1), self.max_backoff)
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), email))
+            self._cond.notify_all()
@@ -0,0 +1,130 @@
+"""
+Local SMTP stand-in: accepts mail on 127.0.0.1 and keeps it in memory instead of delivering it.
+
+Speaks enough of RFC 5321 for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT), can add a
+delay to every reply to look like a remote server and can fail some messages with a temporary 451
+to exercise retries.
+
+Usage: python -m notifications.local_smtp [port]
+"""
+import random
+import socketserver
+import sys
+import time
+from threading import Lock, Thread
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    # Replies are small writes, Nagle's algorithm would hold each one back for an ACK
+    disable_nagle_algorithm = True
+
+    def reply(self, line: str):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 localhost local SMTP stand-in")
+        mail_from, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-localhost\r\n250-8BITMIME\r\n")
+                self.reply("250 SMTPUTF8")
+            elif verb == "HELO":
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                mail_from, recipients = command[10:].strip().strip("<>").split(">")[0], []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip().strip("<>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in iter(self.rfile.readline, b""):
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    # Dot-stuffed lines lose their extra dot
+                    data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                if server.failure_rate and server.random.random() < server.failure_rate:
+                    self.reply("451 Temporary failure, try again later")
+                else:
+                    with server.lock:
+                        server.messages.append((mail_from, recipients, b"".join(data)))
+                    self.reply("250 OK queued")
+                mail_from, recipients = None, []
+            elif verb == "RSET":
+                mail_from, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded SMTP stand-in. port 0 picks a free port, see port once started.
+
+    messages holds (sender, recipients, raw message) of every accepted message and connections
+    counts the connections opened. delay is added before every reply, in seconds, failure_rate is
+    the share of messages refused with a temporary failure.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0, failure_rate: float = 0.0,
+                 seed: int = None):
+        super().__init__((host, port), _SMTPHandler)
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.messages = []
+        self.connections = 0
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "LocalSMTPServer":
+        self._thread = Thread(target=self.serve_forever, daemon=True, name="local-smtp")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    server = LocalSMTPServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8025).start()
+    print(f"Local SMTP stand-in listening on 127.0.0.1:{server.port}, Ctrl+C to stop")
+    try:
+        seen = 0
+        while True:
+            time.sleep(1)
+            for sender, recipients, data in server.messages[seen:]:
+                print(f"{sender} -> {', '.join(recipients)}, {len(data)} bytes")
+            seen = len(server.messages)
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,41 +1,15 @@
+import hashlib
 import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+
 import pandas as pd
 from automation.priority import priority_weights
 
-def summary_tickets_email(tickets: pd.DataFrame):
-    # Assigned Pending Tickets
-    open_tickets = tickets[
-        (tickets['status'].isin(['Open', 'In Progress', 'Waiting for User'])) &
-        ~tickets['category'].isnull() &
-        ~tickets['priority'].isnull() &
-        ~tickets['assignee'].isnull()
-        ]
-    df = open_tickets.copy()
-    df["priority_weight"] = df["priority"].map(priority_weights)
-    # Sort Descending by Assignee and Priority Weight
-    df.sort_values(by=["assignee", "priority_weight"], ascending=False, inplace=True)
-
-    # Group by assignee
-    grouped = df.groupby("assignee")
-
-    output_dir = ".\\notifications\\ticketsSummary"
-    os.makedirs(output_dir, exist_ok=True)
+summary_columns = ['ticket_id', 'summary', 'status', 'assignee', 'category', 'priority']
+summary_subject = "Open Ticket Summary"
 
-    # Generate email bodies per assignee
-    for assignee, group in grouped:
-        filename = os.path.join(output_dir, f"{assignee}.html")
-        generate_email_html(assignee, group, filename)
-
-
-def generate_email_html(assignee, tickets_df: pd.DataFrame, output_path="ticket_summary.html") -> str:
-    style = None
-
-    if tickets_df.empty:
-        html_body = "<p>No open tickets to display.</p>"
-    else:
-        df = tickets_df[['ticket_id', 'summary', 'status', 'assignee', 'category', 'priority']].copy()
-
-        style = """
+# Templates are built once at import, rendering only fills them in
+_style = """
         <style>
             body {
                 font-family: Arial, sans-serif;
@@ -63,12 +37,18 @@ def generate_email_html(assignee, tickets_df: pd.DataFrame, output_path="ticket_
         </style>
         """
 
-        html_table = df.to_html(index=False, escape=False)
-        html_body = f"""
+_page = """
+    <html>
+        <head>{style}</head>
+        <body>{body}</body>
+    </html>
+    """
+
+_body = """
         <h2>Open Ticket Summary</h2>
         <p>Hi {assignee},</p>
         <p>Here is a summary of your currently assigned <b>Open</b> tickets, sorted by priority:</p>
-        {html_table}
+        {table}
         
         <p>Please address these as soon as possible based on urgency.</p>
         
@@ -78,18 +58,147 @@ def generate_email_html(assignee, tickets_df: pd.DataFrame, output_path="ticket_
         </p>
         """
 
-    html = f"""
-    <html>
-        <head>{style}</head>
-        <body>{html_body}</body>
-    </html>
+_empty_body = "<p>No open tickets to display.</p>"
+
+# Same markup as DataFrame.to_html(index=False, escape=False)
+_table_head = ('<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n'
+               + "".join(f"      <th>{col}</th>\n" for col in summary_columns)
+               + "    </tr>\n  </thead>\n  <tbody>\n")
+_table_row = "    <tr>\n" + "      <td>{}</td>\n" * len(summary_columns) + "    </tr>\n"
+_table_tail = "  </tbody>\n</table>"
+
+
+def summarized_tickets(tickets: pd.DataFrame) -> pd.DataFrame:
+    """Assigned pending tickets, the ones listed in the summaries."""
+    return tickets[
+        (tickets['status'].isin(['Open', 'In Progress', 'Waiting for User'])) &
+        ~tickets['category'].isnull() &
+        ~tickets['priority'].isnull() &
+        ~tickets['assignee'].isnull()
+        ]
+
+
+def render_summary_html(assignee, rows: list) -> str:
+    """Summary page of an assignee, rows are tuples of the summary_columns values."""
+    if not rows:
+        return _page.format(style="", body=_empty_body)
+    table = _table_head + "".join(_table_row.format(*row) for row in rows) + _table_tail
+    return _page.format(style=_style, body=_body.format(assignee=assignee, table=table))
+
+
+def write_atomically(path: str, content: str):
+    """Write through a temporary file and rename it, readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _write_summary(assignee, rows: list, path: str, digest, with_html: bool = False) -> tuple:
+    """
+    Render one summary and write it when its content changed. Module-level so it can run on a process pool.
+
+    Returns:
+        tuple: The digest of the file, whether it was rewritten, and the summary when with_html (None otherwise).
+    """
+    html = render_summary_html(assignee, rows)
+    kept = html if with_html else None
+    new_digest = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    if digest is None and os.path.exists(path):
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    if new_digest == digest:
+        return digest, False, kept
+    write_atomically(path, html)
+    return new_digest, True, kept
+
+
+class SummaryRenderer:
+    """
+    Writes one HTML summary per assignee.
+
+    Assignee groups are rendered on an executor (a thread pool unless one is given, a
+    ProcessPoolExecutor works too), a file is only rewritten when the hash of its content
+    changed, and every write goes through a temporary file and a rename. Given a dispatcher
+    (see notifications.dispatch), every rendered summary is also emailed to its assignee, the
+    dispatcher skips the ones it already sent.
+    """
+
+    def __init__(self, output_dir: str = os.path.join("notifications", "ticketsSummary"), executor: Executor = None,
+                 max_workers: int = None):
+        self.output_dir = output_dir
+        self.executor = executor if executor else ThreadPoolExecutor(max_workers=max_workers,
+                                                                     thread_name_prefix="summary")
+        # Digest of each file as last written, so unchanged summaries are detected without reading them back
+        self._digests = {}
+
+    def render(self, tickets: pd.DataFrame, assignees=None, dispatcher=None, addresses: dict = None) -> dict:
+        """
+        Writes the summary of every assignee, or only of the given assignees (including the ones left without
+        tickets). Returns assignee -> whether the file was rewritten.
+
+        With a dispatcher, the rendered summaries are queued as emails to the assignees found in addresses
+        (assignee -> email address), unchanged or not: a file written before a restart, or before the
+        dispatcher was given, was not necessarily sent. The dispatcher drops the content it already sent.
+        """
+        # Assigned Pending Tickets
+        open_tickets = summarized_tickets(tickets)
+        if assignees is not None:
+            open_tickets = open_tickets[open_tickets['assignee'].isin(assignees)]
+        # Object columns, categorical ones would sort by category order instead of by value
+        df = open_tickets[summary_columns].astype(object)
+        df["priority_weight"] = df["priority"].map(priority_weights)
+        # Sort Descending by Assignee and Priority Weight
+        df.sort_values(by=["assignee", "priority_weight"], ascending=False, inplace=True)
+
+        groups = {assignee: list(group[summary_columns].itertuples(index=False, name=None))
+                  for assignee, group in df.groupby("assignee", sort=False)}
+        if assignees is not None:
+            for assignee in set(assignees) - set(groups):
+                groups[assignee] = []
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = [os.path.join(self.output_dir, f"{assignee}.html") for assignee in groups]
+        # Only the summaries to email come back from the executor
+        emailed = [dispatcher is not None and bool(addresses) and assignee in addresses for assignee in groups]
+        results = self.executor.map(_write_summary, list(groups), list(groups.values()), paths,
+                                    [self._digests.get(path) for path in paths], emailed, chunksize=16)
+
+        written = {}
+        for assignee, path, (digest, changed, html) in zip(groups, paths, results):
+            # Kept even when unchanged, a digest read back from disk is not read again
+            self._digests[path] = digest
+            written[assignee] = changed
+            if html is not None:
+                dispatcher.submit(assignee, addresses[assignee], summary_subject, html)
+        return written
+
+    def close(self):
+        self.executor.shutdown()
+
+
+_renderer = None
+
+
+def summary_tickets_email(tickets: pd.DataFrame, assignees=None, dispatcher=None, addresses: dict = None) -> dict:
+    """
+    Writes the summary of every assignee, or only of the given assignees (including the ones left without tickets).
+    With a dispatcher, the summaries are also emailed to the assignees' addresses, unless already sent.
     """
+    global _renderer
+    if _renderer is None:
+        _renderer = SummaryRenderer()
+    return _renderer.render(tickets, assignees, dispatcher, addresses)
+
+
+def generate_email_html(assignee, tickets_df: pd.DataFrame, output_path="ticket_summary.html") -> str:
+    rows = list(tickets_df[summary_columns].itertuples(index=False, name=None)) if not tickets_df.empty else []
+    html = render_summary_html(assignee, rows)
 
     # Save to HTML file
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(html)
+    write_atomically(output_path, html)
 
     return html
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,69 @@
+"""
+Crash recovery of the Closed ticket archive: a crash on either side of the table commit leaves every ticket
+in exactly one of the table and the archive once the tickets are loaded again.
+"""
+import os
+import shutil
+from collections import Counter
+
+import pytest
+
+from database import JiraMockService
+
+users_source = os.path.join(os.path.dirname(__file__), os.pardir, "database", "jira_users.csv")
+
+
+@pytest.fixture
+def files(tmp_path):
+    users_file = tmp_path / "jira_users.csv"
+    shutil.copy(users_source, users_file)
+    return str(tmp_path / "jira_tickets.csv"), str(users_file)
+
+
+def _close_one(files, storage: str):
+    """Tickets saved with the archive, then one of them closed and paged out without settling. Returns its ID."""
+    tickets_file, users_file = files
+    jira = JiraMockService(tickets_file, users_file, storage=storage, archive_closed=True)
+    jira.initializeData()
+    jira.save()
+    jira.auto_save = False
+    service = jira.tickets_service
+    ticket_id = service.data.loc[service.data['status'] != 'Closed', 'ticket_id'].iloc[0]
+    jira.update_ticket(ticket_id, {'status': 'Closed'})
+    return service, ticket_id
+
+
+def _locations(files, storage: str) -> tuple:
+    """Every ticket ID of the reloaded table and of its archive, each with its number of copies."""
+    tickets_file, users_file = files
+    service = JiraMockService(tickets_file, users_file, auto_save=False, storage=storage,
+                              archive_closed=True).tickets_service
+    assert not service.archive.is_pending()
+    archived = Counter(ticket_id for chunk in service.archive.iter_chunks(10_000) for ticket_id in chunk['ticket_id'])
+    return Counter(service.data['ticket_id']), archived
+
+
+@pytest.mark.parametrize("storage", ["csv", "log"])
+def test_crash_before_table_commit(files, storage):
+    service, ticket_id = _close_one(files, storage)
+    # Appended to the archive, the table without the ticket never committed
+    service.take_changes()
+    assert service.archive.is_pending()
+
+    in_table, archived = _locations(files, storage)
+    assert set(in_table) | set(archived) == {f"TKT-{n:04d}" for n in range(1, 501)}
+    assert all(in_table[key] + archived[key] == 1 for key in in_table | archived)
+    assert in_table[ticket_id] == 1
+
+
+@pytest.mark.parametrize("storage", ["csv", "log"])
+def test_crash_after_table_commit_before_settle(files, storage):
+    service, ticket_id = _close_one(files, storage)
+    # The table without the ticket is committed, the archive is still marked pending
+    service.storage.commit(*service.take_changes())
+    assert service.archive.is_pending()
+
+    in_table, archived = _locations(files, storage)
+    assert set(in_table) | set(archived) == {f"TKT-{n:04d}" for n in range(1, 501)}
+    assert all(in_table[key] + archived[key] == 1 for key in in_table | archived)
+    assert archived[ticket_id] == 1